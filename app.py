@@ -11,31 +11,50 @@ AI 家庭漫画管家 - Streamlit 可视化后台
 
 import streamlit as st
 import asyncio
+import atexit
 import base64
 import hashlib
 import hmac
 import json
 import os
+import re
 import secrets
 import sys
 from datetime import datetime, date
 from pathlib import Path
 import threading
 import time
-from typing import List, Optional
+from collections import OrderedDict, deque
+from concurrent.futures import Future
+from types import MappingProxyType
+from typing import Any, Callable, Deque, Dict, List, Mapping, Optional, Tuple
+
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
+try:
+    from streamlit_autorefresh import st_autorefresh
+    AUTOREFRESH_AVAILABLE = True
+except ImportError:
+    AUTOREFRESH_AVAILABLE = False
+
+# 项目目录与数据目录
+APP_DIR = Path(__file__).parent
+DATA_DIR = APP_DIR / "data"
+CAPTURE_DIR = DATA_DIR / "captures"
+CARTOON_DIR = DATA_DIR / "cartoons"
+COLLAGE_DIR = DATA_DIR / "collages"
 
 # 添加项目路径
-sys.path.insert(0, str(Path(__file__).parent))
+sys.path.insert(0, str(APP_DIR))
 
 from config_manager import get_config_manager
 from ranking_manager import RankingManager
 from rtsp_capture import get_rtsp_capture, RTSPCapture
-from vision_client import get_vision_client
-from push_client import get_push_client
 from scheduler import get_scheduler
-from image_utils import create_comic_collage, save_collage
-from gemini_client import get_gemini_client
-from detector.local_detector import FaceDetector
 
 
 # ========== 页面配置 ==========
@@ -48,7 +67,7 @@ st.set_page_config(
 
 
 # ========== 自定义样式 ==========
-st.markdown("""
+_CSS_HTML = """
 <style>
     @import url('https://fonts.googleapis.com/css2?family=Fredoka:wght@400;500;600;700&family=Nunito:wght@300;400;500;600;700&display=swap');
     :root {
@@ -236,27 +255,204 @@ st.markdown("""
     header { visibility: hidden; height: 0%; }
     footer { visibility: hidden; height: 0%; }
 </style>
-""", unsafe_allow_html=True)
+"""
+
+
+def inject_styles():
+    """
+    注入自定义样式
+    
+    注意：Streamlit 每次重跑都会用本次输出替换页面元素，
+    跳过该调用会导致样式在下次刷新时丢失，因此每次重跑都需要输出。
+    """
+    st.markdown(_CSS_HTML, unsafe_allow_html=True)
 
 
 # ========== 全局状态管理 ==========
+class LogBuffer:
+    """
+    日志缓冲区
+    
+    连续产生的日志先暂存，首条日志 delay 秒后（或积累 max_entries 条时）
+    一次性写入 sink，减少突发日志时的逐条写入和控制台输出
+    """
+    
+    def __init__(self, sink: Callable[[List[str]], None], delay: float = 0.05, max_entries: int = 32):
+        self._sink = sink
+        self._delay = delay
+        self._max_entries = max_entries
+        self._pending: List[str] = []
+        self._cond = threading.Condition()
+        # 写出锁：取出批次和写入 sink 在同一把锁内完成，保证并发刷新时批次按顺序写出
+        self._write_lock = threading.Lock()
+        # 常驻的刷新线程，不再为每次突发日志新建 Timer 线程
+        threading.Thread(target=self._run, name="log-flusher", daemon=True).start()
+    
+    def add(self, entry: str):
+        """添加一条日志，由刷新线程延迟写出"""
+        with self._cond:
+            self._pending.append(entry)
+            if len(self._pending) == 1 or len(self._pending) >= self._max_entries:
+                self._cond.notify()
+    
+    def _run(self):
+        """刷新线程：首条日志到达后等待 delay 秒（或积累 max_entries 条）再一次性写出"""
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._pending)
+                self._cond.wait_for(lambda: len(self._pending) >= self._max_entries, timeout=self._delay)
+            try:
+                self.flush()
+            except Exception as e:
+                sys.stderr.write(f"[Log] 写出日志失败: {e}\n")
+    
+    def flush(self):
+        """立即写出所有暂存日志"""
+        with self._write_lock:
+            with self._cond:
+                batch, self._pending = self._pending, []
+            if batch:
+                self._sink(batch)
+
+
 class GlobalState:
     def __init__(self):
-        self.logs: List[str] = []
+        self.logs: Deque[str] = deque(maxlen=100)  # 只保留最近 100 条
+        self.log_seq: int = 0  # 日志序号，每条新日志递增，用于判断是否需要刷新界面
+        self.log_buffer = LogBuffer(self._write_logs)
+        atexit.register(self.log_buffer.flush)
+        # 按级别分桶的最近日志，侧边栏筛选时直接读取
+        self.logs_by_level: Dict[str, Deque[str]] = {
+            tag: deque(maxlen=LOG_DISPLAY_COUNT) for tag in LOG_LEVEL_TAGS
+        }
         self.ranking_manager: Optional[RankingManager] = None
         self.last_capture_time: Optional[datetime] = None
         self.rtsp_connected: bool = False
         
+        # 常驻 RTSP 捕获器（后台线程持续拉流）
+        self.rtsp_capture: Optional[RTSPCapture] = None
+        self.rtsp_lock = threading.Lock()
+        
+        # 今日抓拍计数缓存（避免每次刷新扫描目录）
+        self.today_date: Optional[date] = None
+        self.today_capture_count: int = 0
+        self.capture_count_lock = threading.Lock()
+        
+        # 常驻 API 客户端（按 token 缓存，复用连接池）
+        self.clients: Dict[tuple, Any] = {}
+        self.clients_lock = threading.Lock()
+        atexit.register(self.close_clients)
+        
+        # 常驻后台事件循环（定时任务共用，避免每次 asyncio.run 重建）
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_lock = threading.Lock()
+        
+        # 进行中的定时抓拍/推送任务（上一次未完成时跳过本次触发）
+        self.capture_future: Optional[Future] = None
+        self.push_future: Optional[Future] = None
+        
+        # 登录尝试记录（按客户端 IP 限流，避免密码哈希被刷）
+        self.login_attempts: "OrderedDict[str, Deque[float]]" = OrderedDict()
+        self.login_lock = threading.Lock()
+        
         # 初始化 ranking_manager
         config = get_config_manager()
-        data_dir = Path(__file__).parent / "data"
-        self.ranking_manager = RankingManager(str(data_dir), config.get('top_n', 3))
+        self.ranking_manager = RankingManager(str(DATA_DIR), config.get('top_n', 3))
+    
+    def _write_logs(self, batch: List[str]):
+        """将一批日志写入全局日志并输出到控制台"""
+        self.logs.extend(batch)
+        self.log_seq += len(batch)
+        for entry in batch:
+            for tag in LOG_LEVEL_TAGS:
+                if tag in entry:
+                    self.logs_by_level[tag].append(entry)
+        # 如果在 Streamlit 上下文中，也可以尝试打印到控制台辅助调试
+        sys.stdout.write("".join(f"[Log] {entry}\n" for entry in batch))
+    
+    def get_client(self, key: tuple, factory: Callable[[], Any]) -> Any:
+        """按 key 获取缓存的客户端，不存在时用 factory 创建"""
+        with self.clients_lock:
+            if key not in self.clients:
+                self.clients[key] = factory()
+            return self.clients[key]
+    
+    def get_loop(self) -> asyncio.AbstractEventLoop:
+        """获取常驻后台事件循环，首次调用时在守护线程中启动"""
+        with self._loop_lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name="comic-butler-loop", daemon=True).start()
+                self._loop = loop
+            return self._loop
+    
+    def close_clients(self):
+        """进程退出时关闭所有客户端连接"""
+        with self.clients_lock:
+            clients = [c for c in self.clients.values() if c is not None]
+            self.clients.clear()
+        for client in clients:
+            try:
+                # 会话绑定在后台循环上，需在同一循环中关闭
+                if self._loop is not None and self._loop.is_running():
+                    asyncio.run_coroutine_threadsafe(client.close(), self._loop).result(timeout=5)
+                else:
+                    asyncio.run(client.close())
+            except Exception as e:
+                print(f"[Log] 关闭客户端失败: {e}")
 
 @st.cache_resource
-def get_global_state() -> GlobalState:
+def _create_global_state() -> GlobalState:
     return GlobalState()
 
-AUTH_FILE = Path(__file__).parent / "data" / "auth.json"
+
+# 本次脚本执行内的快速引用：Streamlit 每次 rerun 会重新执行本文件，
+# 模块级变量随之重置，因此跨 rerun 的唯一性仍由 cache_resource 保证
+_global_state: Optional[GlobalState] = None
+_global_state_lock = threading.Lock()
+
+
+def get_global_state() -> GlobalState:
+    """获取全局状态（热路径直接返回模块级引用，不经过 Streamlit 缓存查找）"""
+    global _global_state
+    if _global_state is None:
+        with _global_state_lock:
+            if _global_state is None:
+                _global_state = _create_global_state()
+    return _global_state
+
+
+def submit_to_background_loop(coro) -> Future:
+    """将协程提交到常驻后台事件循环，立即返回 Future"""
+    loop = get_global_state().get_loop()
+    return asyncio.run_coroutine_threadsafe(coro, loop)
+
+
+def run_in_background_loop(coro):
+    """在常驻后台事件循环中执行协程，并阻塞等待结果"""
+    return submit_to_background_loop(coro).result()
+
+
+def get_shared_gemini_client(token: str):
+    """获取共享的 SiliconFlow 客户端"""
+    from gemini_client import get_gemini_client
+    return get_global_state().get_client(("gemini", token), lambda: get_gemini_client(token))
+
+
+def get_shared_push_client(token: str, imgbb_api_key: str):
+    """获取共享的 PushPlus 客户端"""
+    from push_client import get_push_client
+    return get_global_state().get_client(
+        ("push", token, imgbb_api_key), lambda: get_push_client(token, imgbb_api_key)
+    )
+
+
+def get_shared_vision_client(token: str):
+    """获取共享的视觉客户端"""
+    from vision_client import get_vision_client
+    return get_global_state().get_client(("vision", token), lambda: get_vision_client(token))
+
+AUTH_FILE = DATA_DIR / "auth.json"
 
 # ========== Session State 初始化 (仅用于 UI 状态) ==========
 def init_session_state():
@@ -277,23 +473,29 @@ def init_session_state():
     if "auth_user" not in st.session_state:
         st.session_state.auth_user = ""
 
+    # 漫画提示词及其对应的预设风格（每个会话只需判断一次，之后由回调维护）
+    if 'cartoon_prompt_text' not in st.session_state:
+        st.session_state.cartoon_prompt_text = get_config_manager().snapshot().get('cartoon_prompt', '')
+
+    if 'style_selection' not in st.session_state:
+        st.session_state.style_selection = _PRESET_BY_CONTENT.get(
+            st.session_state.cartoon_prompt_text.strip(), "自定义"
+        )
+
 
 def add_log(message: str):
     """添加日志 (全局)"""
     timestamp = datetime.now().strftime("%H:%M:%S")
     log_entry = f"[{timestamp}] {sanitize_log_message(message)}"
     
-    # 更新全局日志
-    state = get_global_state()
-    state.logs.append(log_entry)
-    
-    # 保留最近 100 条
-    if len(state.logs) > 100:
-        state.logs = state.logs[-100:]
-            
-    # 如果在 Streamlit 上下文中，也可以尝试打印到控制台辅助调试
-    print(f"[Log] {log_entry}")
+    # 先进入缓冲区，短时间内批量写入全局日志
+    get_global_state().log_buffer.add(log_entry)
+
 
+# 侧边栏显示的日志条数，以及可筛选的日志级别
+LOG_DISPLAY_COUNT = 20
+LOG_LEVEL_TAGS = ("[ERR]", "[WARN]", "[OK]")
+LOG_FILTERS = {"仅错误": "[ERR]", "仅警告": "[WARN]", "仅成功": "[OK]"}
 
 LOG_REPLACEMENTS = {
     "✅": "[OK]",
@@ -313,24 +515,48 @@ LOG_REPLACEMENTS = {
     "⚙️": "[CFG]",
 }
 
+# 按长度降序拼接，避免带变体选择符的 emoji（如 ⚠️）被其前缀截断
+_LOG_PATTERN = re.compile(
+    "|".join(re.escape(k) for k in sorted(LOG_REPLACEMENTS, key=len, reverse=True))
+)
+
 GRID_COLUMNS = 3
 
 
 def sanitize_log_message(message: str) -> str:
     """将常见 emoji 标记替换为文本标签，提升可读性"""
-    sanitized = message
-    for emoji, text in LOG_REPLACEMENTS.items():
-        sanitized = sanitized.replace(emoji, text)
-    return sanitized
+    return _LOG_PATTERN.sub(lambda m: LOG_REPLACEMENTS[m.group(0)], message)
 
 
 def get_today_capture_count() -> int:
-    """统计今日抓拍数量"""
-    capture_dir = Path(__file__).parent / "data" / "captures"
-    if not capture_dir.exists():
-        return 0
-    date_prefix = date.today().strftime("%Y%m%d")
-    return sum(1 for _ in capture_dir.glob(f"capture_{date_prefix}_*.jpg"))
+    """统计今日抓拍数量（按天缓存，跨天时重新扫描目录）"""
+    state = get_global_state()
+    today = date.today()
+    with state.capture_count_lock:
+        if state.today_date == today:
+            return state.today_capture_count
+        
+        prefix = f"capture_{today.strftime('%Y%m%d')}_"
+        count = 0
+        try:
+            with os.scandir(CAPTURE_DIR) as entries:
+                for entry in entries:
+                    if entry.name.startswith(prefix) and entry.name.endswith(".jpg"):
+                        count += 1
+        except FileNotFoundError:
+            pass
+        
+        state.today_date = today
+        state.today_capture_count = count
+        return count
+
+
+def increment_today_capture_count() -> None:
+    """新抓拍保存后递增今日计数"""
+    state = get_global_state()
+    with state.capture_count_lock:
+        if state.today_date == date.today():
+            state.today_capture_count += 1
 
 
 def render_status_card(title: str, value: str, tone: str = "neutral") -> None:
@@ -351,9 +577,32 @@ def render_status_card(title: str, value: str, tone: str = "neutral") -> None:
     )
 
 
-def render_config_alert():
+# 参与 ConfigManager.validate() 校验的配置项
+VALIDATED_CONFIG_KEYS = (
+    'rtsp_url', 'siliconflow_token', 'pushplus_token',
+    'capture_interval', 'top_n', 'quality_threshold',
+)
+
+
+def parse_push_times(push_times_str: str) -> List[str]:
+    """解析逗号分隔的推送时间，每段只 strip 一次"""
+    push_times = []
+    for t in push_times_str.split(','):
+        t = t.strip()
+        if t:
+            push_times.append(t)
+    return push_times
+
+
+@st.cache_data(ttl=30)
+def _validate_config(signature: tuple) -> tuple:
+    """按校验相关配置项的取值缓存校验结果"""
+    is_valid, errors = get_config_manager().validate()
+    return is_valid, tuple(errors)
+
+
+def render_config_alert(config: Mapping[str, Any]):
     """渲染配置缺失提示"""
-    config = get_config_manager()
     missing = []
     if not config.get("rtsp_url"):
         missing.append("RTSP 地址")
@@ -376,24 +625,52 @@ def render_config_alert():
         )
 
 
-def _hash_password(password: str, salt_bytes: bytes) -> str:
-    digest = hashlib.pbkdf2_hmac("sha256", password.encode("utf-8"), salt_bytes, 120000)
+# 密码哈希算法：pbkdf2_sha256（默认，兼容旧 auth.json）或 scrypt
+KDF_PBKDF2 = "pbkdf2_sha256"
+KDF_SCRYPT = "scrypt"
+
+
+def _resolve_kdf(name: str) -> str:
+    """校验环境变量指定的算法，不支持或当前 Python 不可用时回退 pbkdf2_sha256"""
+    if name == KDF_SCRYPT and not hasattr(hashlib, "scrypt"):
+        print(f"[鉴权] 当前 Python 不支持 scrypt，回退到 {KDF_PBKDF2}")
+        return KDF_PBKDF2
+    if name not in (KDF_PBKDF2, KDF_SCRYPT):
+        print(f"[鉴权] 不支持的密码哈希算法 {name!r}，回退到 {KDF_PBKDF2}")
+        return KDF_PBKDF2
+    return name
+
+
+DEFAULT_KDF = _resolve_kdf(os.getenv("COMIC_BUTLER_KDF", KDF_PBKDF2))
+
+
+def _hash_password(password: str, salt_bytes: bytes, algorithm: str = KDF_PBKDF2) -> str:
+    if algorithm == KDF_SCRYPT:
+        digest = hashlib.scrypt(password.encode("utf-8"), salt=salt_bytes, n=2**14, r=8, p=1, dklen=32)
+    else:
+        digest = hashlib.pbkdf2_hmac("sha256", password.encode("utf-8"), salt_bytes, 120000)
     return base64.b64encode(digest).decode("ascii")
 
 
-def load_auth() -> Optional[dict]:
-    """加载鉴权配置"""
-    if not AUTH_FILE.exists():
-        return None
+@st.cache_resource
+def load_auth() -> Optional[Mapping[str, Any]]:
+    """
+    加载鉴权配置（缓存，save_auth 时失效）
+    
+    缓存对象由所有会话共享，返回只读视图，避免某个会话的修改影响其他用户
+    """
+    # 文件不存在时读取会抛出异常，无需单独 stat
     try:
-        with AUTH_FILE.open("r", encoding="utf-8") as file_handle:
-            data = json.load(file_handle)
+        if ORJSON_AVAILABLE:
+            data = orjson.loads(AUTH_FILE.read_bytes())
+        else:
+            data = json.loads(AUTH_FILE.read_text(encoding="utf-8"))
         if not isinstance(data, dict):
             return None
         if not data.get("username"):
             return None
         if data.get("password_hash") and data.get("salt"):
-            return data
+            return MappingProxyType(data)
     except Exception:
         return None
     return None
@@ -405,14 +682,73 @@ def save_auth(username: str, password: str) -> None:
     salt = secrets.token_bytes(16)
     data = {
         "username": username,
+        "kdf": DEFAULT_KDF,
         "salt": base64.b64encode(salt).decode("ascii"),
-        "password_hash": _hash_password(password, salt),
+        "password_hash": _hash_password(password, salt, DEFAULT_KDF),
     }
-    with AUTH_FILE.open("w", encoding="utf-8") as file_handle:
-        json.dump(data, file_handle, ensure_ascii=False)
+    if ORJSON_AVAILABLE:
+        AUTH_FILE.write_bytes(orjson.dumps(data))
+    else:
+        AUTH_FILE.write_text(json.dumps(data, ensure_ascii=False), encoding="utf-8")
+    load_auth.clear()
+
+
+# 登录限流：每个客户端在时间窗口内最多尝试的次数
+LOGIN_MAX_ATTEMPTS = 5
+LOGIN_WINDOW_SECONDS = 60
+LOGIN_TRACKED_CLIENTS = 1024  # 最多记录的客户端数，超出时淘汰最久未尝试的
+
+
+def _get_client_ip(trusted_proxies: List[str]) -> str:
+    """
+    获取登录限流使用的客户端标识
+    
+    X-Forwarded-For 可由客户端随意伪造：只有直连地址属于受信任代理时才采信，
+    并从右向左取第一个非代理地址，否则一律使用直连地址。
+    旧版 Streamlit 拿不到直连地址时按会话计数，不与其他客户端共用同一计数
+    """
+    try:
+        peer = st.context.ip_address
+    except Exception:
+        peer = None
+    
+    if not peer:
+        if "login_client_key" not in st.session_state:
+            st.session_state.login_client_key = f"session:{secrets.token_hex(8)}"
+        return st.session_state.login_client_key
+    
+    if peer in trusted_proxies:
+        try:
+            forwarded = st.context.headers.get("X-Forwarded-For", "")
+        except Exception:
+            forwarded = ""
+        hops = [h.strip() for h in forwarded.split(",") if h.strip()]
+        for hop in reversed(hops):
+            if hop not in trusted_proxies:
+                return hop
+    return peer
+
+
+def allow_login_attempt(client_ip: str) -> bool:
+    """记录一次登录尝试，时间窗口内超过上限时返回 False"""
+    state = get_global_state()
+    now = time.monotonic()
+    with state.login_lock:
+        attempts = state.login_attempts.get(client_ip)
+        if attempts is None:
+            attempts = state.login_attempts[client_ip] = deque(maxlen=LOGIN_MAX_ATTEMPTS)
+            # 记录数有上限，淘汰最久未尝试的客户端
+            while len(state.login_attempts) > LOGIN_TRACKED_CLIENTS:
+                state.login_attempts.popitem(last=False)
+        else:
+            state.login_attempts.move_to_end(client_ip)
+        if len(attempts) >= LOGIN_MAX_ATTEMPTS and now - attempts[0] < LOGIN_WINDOW_SECONDS:
+            return False
+        attempts.append(now)
+        return True
 
 
-def verify_credentials(auth_data: Optional[dict], username: str, password: str) -> bool:
+def verify_credentials(auth_data: Optional[Mapping[str, Any]], username: str, password: str) -> bool:
     """验证用户名和密码"""
     if not auth_data or not username or not password:
         return False
@@ -423,12 +759,17 @@ def verify_credentials(auth_data: Optional[dict], username: str, password: str)
     except Exception:
         return False
     expected = auth_data.get("password_hash", "")
-    actual = _hash_password(password, salt)
+    # 旧版 auth.json 没有 kdf 字段，按 pbkdf2_sha256 处理
+    actual = _hash_password(password, salt, auth_data.get("kdf", KDF_PBKDF2))
     return hmac.compare_digest(actual, expected)
 
 
 def render_auth_gate() -> bool:
     """渲染鉴权入口，返回是否已通过鉴权"""
+    # 已登录时无需读取鉴权文件
+    if st.session_state.authenticated:
+        return True
+
     auth_data = load_auth()
 
     if not auth_data:
@@ -456,9 +797,6 @@ def render_auth_gate() -> bool:
         st.markdown("</div>", unsafe_allow_html=True)
         return False
 
-    if st.session_state.authenticated:
-        return True
-
     st.markdown('<div class="section-card">', unsafe_allow_html=True)
     st.subheader("登录")
     st.caption("请输入账号密码以进入主界面。")
@@ -468,7 +806,9 @@ def render_auth_gate() -> bool:
         submitted = st.form_submit_button("登录", use_container_width=True)
 
     if submitted:
-        if verify_credentials(auth_data, username.strip(), password):
+        if not allow_login_attempt(_get_client_ip(get_config_manager().get('trusted_proxies', []))):
+            st.error("尝试次数过多，请稍后再试")
+        elif verify_credentials(auth_data, username.strip(), password):
             st.session_state.authenticated = True
             st.session_state.auth_user = username.strip()
             st.success("登录成功。")
@@ -480,18 +820,16 @@ def render_auth_gate() -> bool:
     return False
 
 
-def render_status_bar():
+def render_status_bar(state: GlobalState, ranking_count: int):
     """渲染运行状态概览"""
-    state = get_global_state()
     scheduler_status = get_global_scheduler().get_status()
-    rankings = state.ranking_manager.get_rankings()
 
     rtsp_value = "已连接" if state.rtsp_connected else "未连接"
     rtsp_tone = "ok" if state.rtsp_connected else "bad"
     scheduler_value = "运行中" if scheduler_status.get("running") else "未启动"
     scheduler_tone = "ok" if scheduler_status.get("running") else "warn"
     capture_count = f"{get_today_capture_count()} 张"
-    selected_count = f"{len(rankings)} 张"
+    selected_count = f"{ranking_count} 张"
 
     cols = st.columns(4)
     with cols[0]:
@@ -508,18 +846,42 @@ def render_status_bar():
 
 
 # ========== 核心功能 ==========
-async def do_capture_and_score():
-    """执行抓拍和打分 - 使用 Gemini API"""
-    config = get_config_manager()
+def get_live_capture(rtsp_url: str) -> RTSPCapture:
+    """
+    获取常驻的 RTSP 捕获器
+    
+    首次调用（或 RTSP 地址变化）时建立连接并启动后台拉流，
+    之后的抓拍直接从帧缓冲区取最新帧，无需重复握手。
+    """
     state = get_global_state()
+    with state.rtsp_lock:
+        capture = state.rtsp_capture
+        if capture is None or capture.rtsp_url != rtsp_url:
+            if capture is not None:
+                capture.release()
+            capture = get_rtsp_capture(rtsp_url)
+            capture.connect()
+            # 即使首次连接失败，后台线程也会按间隔自动重连
+            capture.start_background_capture()
+            state.rtsp_capture = capture
+        return capture
+
+
+async def do_capture_and_score(cfg: Optional[Mapping[str, Any]] = None):
+    """
+    执行抓拍和打分 - 使用 Gemini API
     
-    # 每次抓拍时重新创建 RTSP 连接，确保获取最新画面
+    Args:
+        cfg: 配置快照，为 None 时读取当前配置
+    """
+    config = cfg if cfg is not None else get_config_manager().snapshot()
+    state = get_global_state()
+    
+    # 复用常驻连接，后台线程持续拉流保证画面最新
     rtsp_url = config.get('rtsp_url')
-    capture = get_rtsp_capture(rtsp_url)
+    capture = get_live_capture(rtsp_url)
     
-    # 强制重新连接
-    capture.release()
-    if not capture.connect():
+    if not capture.is_connected():
         state.rtsp_connected = False
         add_log("❌ RTSP 连接失败")
         return None, 0.0
@@ -527,32 +889,38 @@ async def do_capture_and_score():
     
     # 抓拍
     add_log("正在抓拍...")
-    data_dir = Path(__file__).parent / "data" / "captures"
-    image_path = capture.capture_and_save(str(data_dir))
+    # 阻塞操作放到线程中执行，避免卡住共享事件循环
+    frame = await asyncio.to_thread(capture.capture)
     
-    if not image_path:
+    if frame is None:
         add_log("❌ 抓拍失败：无法获取画面")
         return None, 0.0
     
     state.last_capture_time = datetime.now()
-    add_log(f"✅ 抓拍成功: {Path(image_path).name}")
     
-    # 本地人脸检测 (如果启用)
+    # 本地人脸检测 (如果启用)：直接使用内存中的画面，无需从磁盘重新解码
     if config.get('enable_face_detection', False):
         add_log("🔍 正在进行本地人脸检测...")
+        # 延迟导入：ultralytics 加载较重，仅在启用人脸检测时导入
+        from detector.local_detector import FaceDetector
         detector = FaceDetector.get_instance()
-        if not detector.detect_faces(image_path):
+        if not await asyncio.to_thread(detector.detect_faces, frame):
             add_log("⚠️ 未检测到人脸 (YOLO)，跳过评分")
-            try:
-                os.remove(image_path)
-            except: pass
             return None, 0.0
         
         add_log("👤 检测到人脸 (YOLO)，继续分析...")
+    
+    image_path = await asyncio.to_thread(capture.save_frame, frame, str(CAPTURE_DIR))
+    if not image_path:
+        add_log("❌ 抓拍失败：保存图片失败")
+        return None, 0.0
+    # 只统计实际落盘的抓拍，与磁盘上的图片保持一致
+    increment_today_capture_count()
+    add_log(f"✅ 抓拍成功: {Path(image_path).name}")
 
     # 优先使用 SiliconFlow AI 进行分析
     siliconflow_token = config.get('siliconflow_token', '')
-    gemini_client = get_gemini_client(siliconflow_token) if siliconflow_token else None
+    gemini_client = get_shared_gemini_client(siliconflow_token) if siliconflow_token else None
     
     if gemini_client:
         add_log("🤖 使用 SiliconFlow AI 进行分析...")
@@ -561,32 +929,26 @@ async def do_capture_and_score():
         add_log("正在进行审美打分...")
         score = await gemini_client.score_image(image_path)
         add_log(f"✅ 审美评分: {score:.3f}")
-        
-        await gemini_client.close()
     else:
         # 降级使用 ModelScope 模拟客户端
         add_log("⚠️ Gemini 不可用，使用模拟评分")
-        vision_client = get_vision_client(config.get('modelscope_token', ''))
-        has_person, label, conf = await vision_client.classify_image(image_path)
+        vision_client = get_shared_vision_client(config.get('modelscope_token', ''))
+        # 检测与打分共用一次图片编码，无人时跳过打分
+        has_person, label, conf, score = await vision_client.analyze(image_path)
         
         if not has_person:
             add_log(f"⚠️ 未检测到人物")
-            try:
-                os.remove(image_path)
-            except:
-                pass
-            await vision_client.close()
+            Path(image_path).unlink(missing_ok=True)
             return None, 0.0
         
         add_log(f"✅ 检测到人物: {label} (置信度: {conf:.2f})")
-        score = await vision_client.score_image(image_path)
         add_log(f"✅ 审美评分: {score:.3f}")
-        await vision_client.close()
     
     return image_path, score
 
 
-async def do_add_to_ranking(image_path: str, score: float, keep_for_preview: bool = False):
+async def do_add_to_ranking(image_path: str, score: float, keep_for_preview: bool = False,
+                            cfg: Optional[Mapping[str, Any]] = None):
     """
     将图片加入排名
     
@@ -598,14 +960,14 @@ async def do_add_to_ranking(image_path: str, score: float, keep_for_preview: boo
         image_path: 图片路径
         score: 评分
         keep_for_preview: 是否保留图片用于预览（即使未入选也不删除）
+        cfg: 配置快照，为 None 时读取当前配置
     """
-    config = get_config_manager()
+    config = cfg if cfg is not None else get_config_manager().snapshot()
     ranking_manager = get_global_state().ranking_manager
     top_n = config.get('top_n', 3)
     
-    # 获取当前排名
-    current_rankings = ranking_manager.get_rankings()
-    current_count = len(current_rankings)
+    # 获取当前排名数量
+    current_count = ranking_manager.count()
     
     # 判断是否应该入选
     should_add = False
@@ -617,7 +979,7 @@ async def do_add_to_ranking(image_path: str, score: float, keep_for_preview: boo
         reason = f"精选不足 {top_n} 张，自动入选"
     else:
         # 精选已满，比较评分
-        lowest_score = current_rankings[-1].score if current_rankings else 0
+        lowest_score = ranking_manager.min_score()
         if score > lowest_score:
             should_add = True
             reason = f"评分 {score:.3f} 高于最低分 {lowest_score:.3f}"
@@ -639,45 +1001,50 @@ async def do_add_to_ranking(image_path: str, score: float, keep_for_preview: boo
     return False
 
 
-async def do_cartoon_redraw():
-    """漫画重绘 - 使用 Gemini API"""
-    config = get_config_manager()
-    ranking_manager = get_global_state().ranking_manager
-    rankings = ranking_manager.get_rankings()
-    
-    if not rankings:
-        add_log("⚠️ 没有可重绘的照片")
-        return []
-    
-    # 初始化 AI 客户端 (SiliconFlow)
-    siliconflow_token = config.get('siliconflow_token', '')
-    if not siliconflow_token:
-         add_log("⚠️ SiliconFlow Token 未配置，AI 功能不可用")
-    
-    gemini_client = get_gemini_client(siliconflow_token)
-    if siliconflow_token:
-        add_log("🎨 AI 引擎就绪 (SiliconFlow)")
+# 漫画重绘的最大并发请求数
+REDRAW_CONCURRENCY = 3
+
+
+def _list_dir_names(directory: Path) -> set:
+    """一次 scandir 读取目录下的文件名集合"""
+    try:
+        with os.scandir(directory) as entries:
+            return {entry.name for entry in entries}
+    except FileNotFoundError:
+        return set()
+
+
+def _exists_in_snapshot(path: str, directory: Path, names: set) -> bool:
+    """用目录快照判断文件是否存在，不在该目录下的路径回退到 os.path.exists"""
+    p = Path(path)
+    if p.parent == directory:
+        return p.name in names
+    return os.path.exists(path)
+
+
+async def _redraw_one(i: int, total: int, item, sem: asyncio.Semaphore,
+                      gemini_client, ranking_manager: RankingManager, cartoon_dir: Path,
+                      existing_cartoons: set, capture_dir: Path, existing_captures: set):
+    """
+    重绘单张照片
     
-    cartoon_dir = Path(__file__).parent / "data" / "cartoons"
+    existing_cartoons / existing_captures 为重绘开始前的目录快照
     
-    results = []
-    new_count = 0
-    skip_count = 0
+    Returns:
+        ((图片路径, 时间戳) 或 None, 状态) ，状态为 new / skip / fail / missing
+    """
+    # 如果已经重绘过且文件存在，跳过
+    if item.cartoon_path and _exists_in_snapshot(item.cartoon_path, cartoon_dir, existing_cartoons):
+        add_log(f"✅ 第 {i+1} 张已有漫画版本，跳过")
+        return (item.cartoon_path, item.timestamp), "skip"
     
-    for i, item in enumerate(rankings):
-        # 如果已经重绘过且文件存在，跳过
-        if item.cartoon_path and os.path.exists(item.cartoon_path):
-            add_log(f"✅ 第 {i+1} 张已有漫画版本，跳过")
-            results.append((item.cartoon_path, item.timestamp))
-            skip_count += 1
-            continue
-        
-        add_log(f"正在重绘第 {i+1}/{len(rankings)} 张...")
+    async with sem:
+        add_log(f"正在重绘第 {i+1}/{total} 张...")
         
         # 检查原图是否存在
-        if not os.path.exists(item.image_path):
+        if not _exists_in_snapshot(item.image_path, capture_dir, existing_captures):
             add_log(f"⚠️ 第 {i+1} 张原图不存在，跳过")
-            continue
+            return None, "missing"
         
         # 生成输出路径
         cartoon_filename = f"cartoon_{Path(item.image_path).stem}.jpg"
@@ -690,18 +1057,58 @@ async def do_cartoon_redraw():
              # 兼容旧版本如果不返回元组
             success = await gemini_client.cartoon_image(item.image_path, cartoon_path)
             error_msg = "未知错误"
+    
+    if success:
+        # 所有任务运行在同一事件循环线程内，且 RankingManager 自带锁，可直接更新
+        ranking_manager.update_cartoon_path(item.image_path, cartoon_path)
+        add_log(f"✅ 第 {i+1} 张重绘完成")
+        return (cartoon_path, item.timestamp), "new"
+    
+    # 重绘失败，使用原图
+    add_log(f"⚠️ 第 {i+1} 张重绘失败: {error_msg}，将使用原图")
+    return (item.image_path, item.timestamp), "fail"
 
-        if success:
-            ranking_manager.update_cartoon_path(item.image_path, cartoon_path)
-            results.append((cartoon_path, item.timestamp))
-            add_log(f"✅ 第 {i+1} 张重绘完成")
-            new_count += 1
-        else:
-            # 重绘失败，使用原图
-            results.append((item.image_path, item.timestamp))
-            add_log(f"⚠️ 第 {i+1} 张重绘失败: {error_msg}，将使用原图")
+
+async def do_cartoon_redraw(cfg: Optional[Mapping[str, Any]] = None):
+    """漫画重绘 - 使用 Gemini API"""
+    config = cfg if cfg is not None else get_config_manager().snapshot()
+    ranking_manager = get_global_state().ranking_manager
+    rankings = ranking_manager.get_rankings()
     
-    await gemini_client.close()
+    if not rankings:
+        add_log("⚠️ 没有可重绘的照片")
+        return []
+    
+    # 初始化 AI 客户端 (SiliconFlow)
+    siliconflow_token = config.get('siliconflow_token', '')
+    if not siliconflow_token:
+         add_log("⚠️ SiliconFlow Token 未配置，AI 功能不可用")
+    
+    gemini_client = get_shared_gemini_client(siliconflow_token)
+    if siliconflow_token:
+        add_log("🎨 AI 引擎就绪 (SiliconFlow)")
+    
+    cartoon_dir = CARTOON_DIR
+    capture_dir = CAPTURE_DIR
+    
+    # 每个目录只读取一次，代替逐张 stat；两次目录读取在线程中并发执行，不阻塞事件循环
+    existing_cartoons, existing_captures = await asyncio.gather(
+        asyncio.to_thread(_list_dir_names, cartoon_dir),
+        asyncio.to_thread(_list_dir_names, capture_dir),
+    )
+    
+    # 各张照片互不依赖，并发调用重绘接口
+    sem = asyncio.Semaphore(REDRAW_CONCURRENCY)
+    outcomes = await asyncio.gather(*[
+        _redraw_one(i, len(rankings), item, sem, gemini_client, ranking_manager, cartoon_dir,
+                    existing_cartoons, capture_dir, existing_captures)
+        for i, item in enumerate(rankings)
+    ])
+    
+    # gather 保持输入顺序，结果仍按排名排列
+    results = [result for result, _ in outcomes if result is not None]
+    new_count = sum(1 for _, status in outcomes if status == "new")
+    skip_count = sum(1 for _, status in outcomes if status == "skip")
     
     # 记录总结
     if new_count > 0:
@@ -712,8 +1119,21 @@ async def do_cartoon_redraw():
     return results
 
 
+@st.cache_data(ttl=5)
+def _today_collage_path(day_iso: str) -> Optional[Tuple[str, int]]:
+    """今日拼图路径及其 mtime（不存在返回 None），短时缓存避免每次刷新都检查文件"""
+    path = COLLAGE_DIR / f"collage_{day_iso}.jpg"
+    try:
+        return str(path), path.stat().st_mtime_ns
+    except OSError:
+        return None
+
+
 async def do_create_collage():
     """创建拼图"""
+    # 延迟导入：拼图依赖 OpenCV/NumPy，仅生成时才加载
+    from image_utils import create_comic_collage, save_collage
+    
     add_log("正在生成漫画连环画...")
     
     # 获取漫画图片路径
@@ -735,11 +1155,11 @@ async def do_create_collage():
         return None
     
     # 保存拼图
-    collage_dir = Path(__file__).parent / "data" / "collages"
     collage_filename = f"collage_{date.today().isoformat()}.jpg"
-    collage_path = str(collage_dir / collage_filename)
+    collage_path = str(COLLAGE_DIR / collage_filename)
     
     if save_collage(collage, collage_path):
+        _today_collage_path.clear()
         add_log(f"✅ 连环画生成完成: {collage_filename}")
         return collage_path
     else:
@@ -747,10 +1167,10 @@ async def do_create_collage():
         return None
 
 
-async def do_push(collage_path: str):
+async def do_push(collage_path: str, cfg: Optional[Mapping[str, Any]] = None):
     """推送到微信"""
-    config = get_config_manager()
-    push_client = get_push_client(
+    config = cfg if cfg is not None else get_config_manager().snapshot()
+    push_client = get_shared_push_client(
         config.get('pushplus_token', ''),
         config.get('imgbb_api_key', '')
     )
@@ -758,7 +1178,7 @@ async def do_push(collage_path: str):
     add_log("正在推送到微信...")
     
     ranking_manager = get_global_state().ranking_manager
-    photo_count = len(ranking_manager.get_rankings())
+    photo_count = ranking_manager.count()
     
     result = await push_client.push_comic_collage(
         collage_path,
@@ -766,8 +1186,6 @@ async def do_push(collage_path: str):
         photo_count=photo_count
     )
     
-    await push_client.close()
-    
     if result.get('code') == 200:
         add_log("✅ 推送成功！")
         return True
@@ -776,44 +1194,75 @@ async def do_push(collage_path: str):
         return False
 
 
-async def do_full_pipeline():
+async def do_full_pipeline(cfg: Optional[Mapping[str, Any]] = None):
     """执行完整流程：重绘 + 拼图 + 推送"""
+    # 整个流程共用一份配置快照
+    cfg = cfg if cfg is not None else get_config_manager().snapshot()
+    
     # 漫画重绘
-    await do_cartoon_redraw()
+    await do_cartoon_redraw(cfg)
     
     # 创建拼图
     collage_path = await do_create_collage()
     
     if collage_path:
         # 推送
-        await do_push(collage_path)
+        await do_push(collage_path, cfg)
     
     return collage_path
 
 
 # ========== 定时任务回调 ==========
 def scheduled_capture_task():
-    """定时抓拍任务（在后台线程中执行）"""
-    async def _run():
-        add_log("⏰ 执行定时抓拍...")
-        image_path, score = await do_capture_and_score()
+    """定时抓拍任务（提交到后台事件循环，不阻塞调度线程）"""
+    state = get_global_state()
+    if state.capture_future is not None and not state.capture_future.done():
+        add_log("⏰ 上一次抓拍尚未完成，跳过本次")
+        return
+    
+    add_log("⏰ 执行定时抓拍...")
+    cfg = get_config_manager().snapshot()
+    
+    def _on_scored(future: Future):
+        try:
+            image_path, score = future.result()
+        except Exception as e:
+            add_log(f"❌ 定时抓拍失败: {e}")
+            return
         if image_path:
-            await do_add_to_ranking(image_path, score)
+            submit_to_background_loop(do_add_to_ranking(image_path, score, cfg=cfg)).add_done_callback(_on_ranked)
+    
+    def _on_ranked(future: Future):
+        try:
+            future.result()
+        except Exception as e:
+            add_log(f"❌ 定时抓拍加入排名失败: {e}")
     
-    asyncio.run(_run())
+    state.capture_future = submit_to_background_loop(do_capture_and_score(cfg))
+    state.capture_future.add_done_callback(_on_scored)
 
 
 def scheduled_push_task():
-    """定时推送任务（在后台线程中执行）"""
-    async def _run():
-        add_log("⏰ 执行定时推送...")
-        await do_full_pipeline()
+    """定时推送任务（提交到后台事件循环，不阻塞调度线程）"""
+    state = get_global_state()
+    if state.push_future is not None and not state.push_future.done():
+        add_log("⏰ 上一次推送尚未完成，跳过本次")
+        return
+    
+    add_log("⏰ 执行定时推送...")
+    
+    def _on_pushed(future: Future):
+        try:
+            future.result()
+        except Exception as e:
+            add_log(f"❌ 定时推送失败: {e}")
     
-    asyncio.run(_run())
+    state.push_future = submit_to_background_loop(do_full_pipeline())
+    state.push_future.add_done_callback(_on_pushed)
 
 
-@st.cache_resource
 def get_global_scheduler():
+    # scheduler 模块只导入一次，其单例本身即跨 rerun 唯一
     return get_scheduler()
 
 def start_scheduler_if_needed():
@@ -828,7 +1277,7 @@ def start_scheduler_if_needed():
     if status['running'] and st.session_state.scheduler_started:
         return
     
-    config = get_config_manager()
+    config = get_config_manager().snapshot()
     
     if not config.get('auto_capture_enabled') and not config.get('auto_push_enabled'):
         return
@@ -849,8 +1298,42 @@ def start_scheduler_if_needed():
 
 
 # ========== 侧边栏 ==========
+# 可选模型列表（模块级常量，避免每次渲染重建）
+SCORING_MODELS = ["THUDM/GLM-4.1V-9B-Thinking", "Qwen/Qwen3-VL-30B-A3B-Instruct", "自定义"]
+# 移除了 Kolors，因为是 T2I 模型不适合重绘
+CARTOON_MODELS = ["Qwen/Qwen-Image-Edit-2509", "自定义"]
+_SCORING_INDEX = {name: i for i, name in enumerate(SCORING_MODELS)}
+_CARTOON_INDEX = {name: i for i, name in enumerate(CARTOON_MODELS)}
+
+# 漫画风格预设
+CARTOON_PRESETS = {
+    "自定义": "",
+    "温馨治愈国漫风": "温馨治愈系国漫风格，柔和的赛璐璐上色，明亮的自然光，色彩清新雅致，线条流畅，高品质，细节丰富，画面温暖，保留图片中人物和背景的主要特征",
+    "经典淡彩连环画风": "经典中国连环画风格，手绘插画质感，清晰的勾线，淡雅的水彩晕染，复古氛围，细腻的笔触，富有故事感，宁静祥和，保留图片中人物和背景的主要特征",
+    "现代清新插画风": "现代清新插画风格，矢量艺术，扁平化设计，明亮的色块，简约时尚，色彩鲜艳，充满活力，保留图片中人物和背景的主要特征"
+}
+CARTOON_PRESET_NAMES = list(CARTOON_PRESETS.keys())
+# 提示词内容 -> 预设名称，用于反查当前提示词是否匹配某个预设
+_PRESET_BY_CONTENT = {v.strip(): k for k, v in CARTOON_PRESETS.items() if k != "自定义"}
+
+
+def _on_style_change():
+    """当选择预设风格时，更新提示词内容"""
+    style = st.session_state.style_selection
+    # 无论何种选择（包括自定义），都更新提示词内容
+    # 自定义在 CARTOON_PRESETS 中对应空字符串，正好清空
+    st.session_state.cartoon_prompt_text = CARTOON_PRESETS[style]
+
+
+def _on_prompt_text_change():
+    """当手动修改提示词时，检查是否匹配预设"""
+    current = st.session_state.cartoon_prompt_text
+    st.session_state.style_selection = _PRESET_BY_CONTENT.get(current.strip(), "自定义")
+
+
 def render_sidebar():
     """渲染侧边栏设置"""
+    state = get_global_state()
     st.sidebar.title("设置")
 
     if st.session_state.get("authenticated"):
@@ -862,7 +1345,7 @@ def render_sidebar():
         st.sidebar.markdown("---")
     
     config = get_config_manager()
-    current_config = config.get_all()
+    current_config = config.snapshot()
     
     # RTSP 设置
     st.sidebar.subheader("摄像头设置")
@@ -902,18 +1385,12 @@ def render_sidebar():
     st.sidebar.subheader("模型选择 (SiliconFlow)")
     
     # Scoring Model
-    scoring_models = ["THUDM/GLM-4.1V-9B-Thinking", "Qwen/Qwen3-VL-30B-A3B-Instruct", "自定义"]
     current_scoring = current_config.get('scoring_model', 'THUDM/GLM-4.1V-9B-Thinking')
-    
-    scoring_index = 0
-    if current_scoring in scoring_models:
-        scoring_index = scoring_models.index(current_scoring)
-    else:
-        scoring_index = 2 # Custom
+    scoring_index = _SCORING_INDEX.get(current_scoring, _SCORING_INDEX["自定义"])
         
     selected_scoring = st.sidebar.selectbox(
         "AI 评分模型",
-        scoring_models,
+        SCORING_MODELS,
         index=scoring_index
     )
     
@@ -922,23 +1399,15 @@ def render_sidebar():
         final_scoring_model = st.sidebar.text_input("输入评分模型名称", value=current_scoring)
 
     # Cartoon Model
-    # 移除了 Kolors，因为是 T2I 模型不适合重绘
-    cartoon_models = ["Qwen/Qwen-Image-Edit-2509", "自定义"]
     current_cartoon = current_config.get('cartoon_model', 'Qwen/Qwen-Image-Edit-2509')
-    
-    cartoon_index = 0
-    if current_cartoon in cartoon_models:
-        cartoon_index = cartoon_models.index(current_cartoon)
-    else:
-        # 如果当前配置是旧的 Kolors，或者其他自定义值
-        if "Kolors" in current_cartoon:
-            cartoon_index = 0 # 默认回 Qwen
-        else:
-            cartoon_index = 1 # Custom
+    cartoon_index = _CARTOON_INDEX.get(current_cartoon)
+    if cartoon_index is None:
+        # 如果当前配置是旧的 Kolors，默认回 Qwen；其他值视为自定义
+        cartoon_index = 0 if "Kolors" in current_cartoon else _CARTOON_INDEX["自定义"]
 
     selected_cartoon = st.sidebar.selectbox(
         "漫画重绘模型",
-        cartoon_models,
+        CARTOON_MODELS,
         index=cartoon_index
     )
     
@@ -1003,49 +1472,11 @@ def render_sidebar():
             help="定义 Gemini 如何对照片进行审美评分"
         )
         
-        # 漫画风格预设
-        CARTOON_PRESETS = {
-            "自定义": "",
-            "温馨治愈国漫风": "温馨治愈系国漫风格，柔和的赛璐璐上色，明亮的自然光，色彩清新雅致，线条流畅，高品质，细节丰富，画面温暖，保留图片中人物和背景的主要特征",
-            "经典淡彩连环画风": "经典中国连环画风格，手绘插画质感，清晰的勾线，淡雅的水彩晕染，复古氛围，细腻的笔触，富有故事感，宁静祥和，保留图片中人物和背景的主要特征",
-            "现代清新插画风": "现代清新插画风格，矢量艺术，扁平化设计，明亮的色块，简约时尚，色彩鲜艳，充满活力，保留图片中人物和背景的主要特征"
-        }
-
-        # 初始化 Session State (如果尚未初始化)
-        if 'cartoon_prompt_text' not in st.session_state:
-            initial_prompt = current_config.get('cartoon_prompt', '')
-            st.session_state.cartoon_prompt_text = initial_prompt
-            
-            # 判断当前提示词是否匹配预设
-            initial_style = "自定义"
-            for name, content in CARTOON_PRESETS.items():
-                if name != "自定义" and content.strip() == initial_prompt.strip():
-                    initial_style = name
-                    break
-            st.session_state.style_selection = initial_style
-
-        def on_style_change():
-            """当选择预设风格时，更新提示词内容"""
-            style = st.session_state.style_selection
-            # 无论何种选择（包括自定义），都更新提示词内容
-            # 自定义在 CARTOON_PRESETS 中对应空字符串，正好清空
-            st.session_state.cartoon_prompt_text = CARTOON_PRESETS[style]
-        
-        def on_prompt_text_change():
-            """当手动修改提示词时，检查是否匹配预设"""
-            current = st.session_state.cartoon_prompt_text
-            new_style = "自定义"
-            for name, content in CARTOON_PRESETS.items():
-                if name != "自定义" and content.strip() == current.strip():
-                    new_style = name
-                    break
-            st.session_state.style_selection = new_style
-
         st.selectbox(
             "选择漫画风格预设",
-            options=list(CARTOON_PRESETS.keys()),
+            options=CARTOON_PRESET_NAMES,
             key="style_selection",
-            on_change=on_style_change,
+            on_change=_on_style_change,
             help="选择预设风格自动填充提示词"
         )
         
@@ -1053,7 +1484,7 @@ def render_sidebar():
             "漫画重绘风格提示词",
             value=st.session_state.cartoon_prompt_text,  # 这里的 value 其实主要由 key 控制
             key="cartoon_prompt_text",
-            on_change=on_prompt_text_change,
+            on_change=_on_prompt_text_change,
             height=150,
             help="定义 AI 如何将照片转换为漫画风格。您可以从上方选择预设，也可以在此处自由编辑。"
         )
@@ -1061,7 +1492,7 @@ def render_sidebar():
     # 保存按钮
     if st.sidebar.button("保存设置", use_container_width=True):
         # 解析推送时间
-        push_times = [t.strip() for t in push_times_str.split(',') if t.strip()]
+        push_times = parse_push_times(push_times_str)
         
         # 更新配置
         new_config = {
@@ -1085,7 +1516,7 @@ def render_sidebar():
         config.update(new_config)
         
         # 更新排名管理器的 Top N
-        get_global_state().ranking_manager.set_top_n(top_n)
+        state.ranking_manager.set_top_n(top_n)
         
         # 更新调度器
         if st.session_state.scheduler_started:
@@ -1100,10 +1531,12 @@ def render_sidebar():
         
         add_log("⚙️ 设置已保存")
         st.sidebar.success("设置已保存！")
-        st.rerun()
+        # 控件已持有新值，主界面在本次运行中随后渲染，无需整页重跑；
+        # 仅刷新下方校验使用的配置快照
+        current_config = config.snapshot()
     
-    # 配置验证
-    is_valid, errors = config.validate()
+    # 配置验证（仅在相关配置变化时重新计算）
+    is_valid, errors = _validate_config(tuple(current_config.get(k) for k in VALIDATED_CONFIG_KEYS))
     if not is_valid:
         st.sidebar.warning("⚠️ 配置问题：")
         for err in errors:
@@ -1119,37 +1552,119 @@ def render_sidebar():
 
     log_filter = st.sidebar.selectbox(
         "日志筛选",
-        ["全部", "仅错误", "仅警告", "仅成功"]
+        ["全部", *LOG_FILTERS]
     )
     
     log_container = st.sidebar.container()
     with log_container:
-        state = get_global_state()
-        # 显示最近的 15 条日志，倒序
-        recent_logs = state.logs[-20:][::-1]
-        if log_filter != "全部":
-            if log_filter == "仅错误":
-                recent_logs = [log for log in recent_logs if "[ERR]" in log]
-            elif log_filter == "仅警告":
-                recent_logs = [log for log in recent_logs if "[WARN]" in log]
-            elif log_filter == "仅成功":
-                recent_logs = [log for log in recent_logs if "[OK]" in log]
-
-        if recent_logs:
-            for log in recent_logs:
-                st.text(log)
+        if auto_refresh and FRAGMENT_AVAILABLE:
+            _log_stream(log_filter)
         else:
-            st.caption("暂无匹配日志")
+            render_log_lines(log_filter)
+
+
+def render_log_lines(log_filter: str):
+    """渲染最近的 20 条日志，倒序"""
+    state = get_global_state()
+    state.log_buffer.flush()
+    tag = LOG_FILTERS.get(log_filter)
+    if tag:
+        recent_logs = list(state.logs_by_level[tag])[::-1]
+    else:
+        recent_logs = list(state.logs)[-LOG_DISPLAY_COUNT:][::-1]
+
+    if recent_logs:
+        # 合并为单个元素，减少每次刷新发送到前端的消息数
+        st.text("\n".join(recent_logs))
+    else:
+        st.caption("暂无匹配日志")
+
+
+# 支持 st.fragment 时，自动刷新只定时重跑日志片段
+FRAGMENT_AVAILABLE = hasattr(st, "fragment")
+
+
+def _log_stream(log_filter: str):
+    """自动刷新的日志片段：没有新日志时只重跑本片段，有新日志时整页刷新"""
+    state = get_global_state()
+    state.log_buffer.flush()
+    if not st.session_state.get('in_full_run') and state.log_seq != st.session_state.get('page_log_seq'):
+        st.rerun()
+    render_log_lines(log_filter)
+
+
+if FRAGMENT_AVAILABLE:
+    _log_stream = st.fragment(run_every=2)(_log_stream)
 
 
 # ========== 主界面 ==========
+def _stat_mtimes(paths: List[str]) -> Dict[str, int]:
+    """批量获取存在的文件的 mtime，不存在的路径不出现在结果中"""
+    mtimes = {}
+    for p in set(paths):
+        if not p:
+            continue
+        try:
+            mtimes[p] = os.stat(p).st_mtime_ns
+        except OSError:
+            pass
+    return mtimes
+
+
+@st.cache_data(max_entries=64)
+def _img_bytes(path: str, mtime_ns: int) -> bytes:
+    """读取图片字节，按 (路径, mtime) 缓存，文件被覆盖时自动失效"""
+    return Path(path).read_bytes()
+
+
+def _show_image(path: str, mtime_ns: int, **kwargs) -> bool:
+    """
+    显示图片；文件在检查之后被删除（排名淘汰、清理预览）时不显示并返回 False
+    """
+    try:
+        data = _img_bytes(path, mtime_ns)
+    except OSError:
+        return False
+    st.image(data, **kwargs)
+    return True
+
+
+def discard_unranked_preview(path: str, ranking_manager: RankingManager, existing_paths: Dict[str, int]):
+    """删除未入选的预览图片（已入选的图片由排名管理器负责清理）"""
+    if ranking_manager.contains(path) or path not in existing_paths:
+        return
+    try:
+        Path(path).unlink(missing_ok=True)
+        add_log("🗑️ 已清理未入选的预览图片")
+    except OSError as e:
+        add_log(f"⚠️ 清理预览图片失败: {e}")
+
+
 def render_main():
     """渲染主界面"""
     st.title("AI 家庭漫画管家")
     st.caption("自动抓拍精彩瞬间，生成漫画风格连环画")
 
-    render_config_alert()
-    render_status_bar()
+    # 全局状态与配置在本次渲染内只获取一次，传给各子组件
+    state = get_global_state()
+    config = get_config_manager().snapshot()
+    
+    # 本次渲染只读取一次排名；是否入选由排名管理器维护的路径集合判断
+    ranking_manager = state.ranking_manager
+    rankings = ranking_manager.get_rankings()
+    
+    render_config_alert(config)
+    render_status_bar(state, len(rankings))
+    
+    # 一次性检查本次渲染用到的所有图片路径是否存在（同时记录 mtime 作为图片缓存键）
+    candidate_paths = [p for item in rankings for p in (item.image_path, item.cartoon_path)]
+    if st.session_state.last_capture_result:
+        candidate_paths.append(st.session_state.last_capture_result['path'])
+    if st.session_state.last_cartoon_results:
+        candidate_paths.extend(p for p, _ in st.session_state.last_cartoon_results)
+    
+    # 每次整页渲染都重新检查，保证被删除或原地覆盖的文件不会按旧状态显示
+    existing_paths = _stat_mtimes(candidate_paths)
     
     # 调试控制区
     st.markdown('<div class="section-card">', unsafe_allow_html=True)
@@ -1163,31 +1678,19 @@ def render_main():
         if st.button("立即抓拍测试", use_container_width=True):
             # 清理上一次未入选的预览图片
             if st.session_state.last_capture_result:
-                old_result = st.session_state.last_capture_result
-                old_path = old_result['path']
-                # 检查是否在排名中
-                is_in_ranking = False
-                for item in get_global_state().ranking_manager.get_rankings():
-                    if item.image_path == old_path:
-                        is_in_ranking = True
-                        break
-                # 如果未入选，删除旧图片
-                if not is_in_ranking and os.path.exists(old_path):
-                    try:
-                        os.remove(old_path)
-                        add_log(f"🗑️ 已清理上次未入选的预览图片")
-                    except:
-                        pass
+                discard_unranked_preview(st.session_state.last_capture_result['path'],
+                                         ranking_manager, existing_paths)
             
             with st.spinner("抓拍中..."):
                 async def _capture():
-                    image_path, score = await do_capture_and_score()
+                    cfg = get_config_manager().snapshot()
+                    image_path, score = await do_capture_and_score(cfg)
                     if image_path:
                         # keep_for_preview=True 保留图片用于预览，即使未入选也不删除
-                        await do_add_to_ranking(image_path, score, keep_for_preview=True)
+                        await do_add_to_ranking(image_path, score, keep_for_preview=True, cfg=cfg)
                     return image_path, score
                 
-                image_path, score = asyncio.run(_capture())
+                image_path, score = run_in_background_loop(_capture())
                 
                 if image_path:
                     # 保存抓拍结果用于预览
@@ -1210,7 +1713,7 @@ def render_main():
                 async def _redraw():
                     return await do_cartoon_redraw()
                 
-                results = asyncio.run(_redraw())
+                results = run_in_background_loop(_redraw())
                 
                 if results:
                     # 保存重绘结果用于预览
@@ -1229,7 +1732,7 @@ def render_main():
                 async def _collage():
                     return await do_create_collage()
                 
-                collage_path = asyncio.run(_collage())
+                collage_path = run_in_background_loop(_collage())
                 
                 if collage_path:
                     st.success("连环画已生成")
@@ -1245,7 +1748,7 @@ def render_main():
                 async def _push():
                     return await do_full_pipeline()
                 
-                collage_path = asyncio.run(_push())
+                collage_path = run_in_background_loop(_push())
                 
                 if collage_path:
                     st.success("推送完成！")
@@ -1263,23 +1766,21 @@ def render_main():
         st.subheader("最新抓拍预览")
         
         result = st.session_state.last_capture_result
-        is_in_ranking = False
         
         # 检查图片是否在排名中
-        rankings = get_global_state().ranking_manager.get_rankings()
-        for item in rankings:
-            if item.image_path == result['path']:
-                is_in_ranking = True
-                break
+        is_in_ranking = ranking_manager.contains(result['path'])
         
         col_preview, col_info = st.columns([2, 1])
         
         with col_preview:
-            if os.path.exists(result['path']):
+            if result['path'] in existing_paths:
                 st.markdown('<div class="image-card">', unsafe_allow_html=True)
-                st.image(result['path'], caption=f"抓拍时间: {result['time']}", use_container_width=True)
+                shown = _show_image(result['path'], existing_paths[result['path']],
+                                    caption=f"抓拍时间: {result['time']}", use_container_width=True)
                 st.markdown('</div>', unsafe_allow_html=True)
             else:
+                shown = False
+            if not shown:
                 st.warning("预览图片已不存在")
         
         with col_info:
@@ -1293,13 +1794,7 @@ def render_main():
                 st.markdown('<span class="badge badge-warning">未入选</span>', unsafe_allow_html=True)
             
             if st.button("关闭预览", use_container_width=True):
-                # 如果图片未入选，删除它
-                if not is_in_ranking and os.path.exists(result['path']):
-                    try:
-                        os.remove(result['path'])
-                        add_log(f"🗑️ 已清理未入选的预览图片")
-                    except:
-                        pass
+                discard_unranked_preview(result['path'], ranking_manager, existing_paths)
                 st.session_state.last_capture_result = None
                 st.rerun()
         st.markdown("</div>", unsafe_allow_html=True)
@@ -1309,19 +1804,21 @@ def render_main():
         st.markdown('<div class="section-card">', unsafe_allow_html=True)
         st.subheader("漫画重绘结果")
         
+        # st.image 经媒体文件管理器以 URL 提供图片，浏览器可缓存，重跑时不必重发图片数据
         results = st.session_state.last_cartoon_results
-        columns_per_row = GRID_COLUMNS
-        for i, (cartoon_path, timestamp) in enumerate(results):
-            if i % columns_per_row == 0:
-                cols = st.columns(columns_per_row)
-            with cols[i % columns_per_row]:
-                st.markdown(f"**#{i+1}** · {timestamp}")
-                if cartoon_path and os.path.exists(cartoon_path):
-                    st.markdown('<div class="image-card">', unsafe_allow_html=True)
-                    st.image(cartoon_path, use_container_width=True)
-                    st.markdown('</div>', unsafe_allow_html=True)
-                else:
-                    st.warning("图片不可用")
+        for row_start in range(0, len(results), GRID_COLUMNS):
+            cols = st.columns(GRID_COLUMNS)
+            for j, (cartoon_path, timestamp) in enumerate(results[row_start:row_start + GRID_COLUMNS]):
+                with cols[j]:
+                    st.markdown(f"**#{row_start + j + 1}** · {timestamp}")
+                    if cartoon_path in existing_paths:
+                        st.markdown('<div class="image-card">', unsafe_allow_html=True)
+                        shown = _show_image(cartoon_path, existing_paths[cartoon_path], use_container_width=True)
+                        st.markdown('</div>', unsafe_allow_html=True)
+                    else:
+                        shown = False
+                    if not shown:
+                        st.warning("图片不可用")
         
         # 关闭预览按钮
         if st.button("关闭重绘预览", use_container_width=True):
@@ -1333,48 +1830,57 @@ def render_main():
     st.markdown('<div class="section-card">', unsafe_allow_html=True)
     st.subheader("今日精选")
     
-    rankings = get_global_state().ranking_manager.get_rankings()
-    
     if rankings:
-        columns_per_row = GRID_COLUMNS
-        for i, item in enumerate(rankings):
-            if i % columns_per_row == 0:
-                cols = st.columns(columns_per_row)
-            with cols[i % columns_per_row]:
-                st.markdown(f"**#{i+1}** · {item.timestamp}")
-                
-                # 显示图片
-                display_path = item.cartoon_path if item.cartoon_path and os.path.exists(item.cartoon_path) else item.image_path
-                
-                if display_path and os.path.exists(display_path):
-                    st.markdown('<div class="image-card">', unsafe_allow_html=True)
-                    st.image(display_path, use_container_width=True)
-                    st.markdown('</div>', unsafe_allow_html=True)
-                else:
-                    st.info("图片不可用")
-                
-                st.caption(f"评分: {item.score:.3f}")
-                
-                # 删除按钮
-                if st.button("删除", key=f"delete_{i}", use_container_width=True):
-                    get_global_state().ranking_manager.remove_image(item.image_path)
-                    add_log(f"🗑️ 已删除精选照片 #{i+1}")
-                    st.rerun()
+        # 预先确定每张卡片的显示图片（优先漫画，其次原图，不可用为 None）
+        cards = []
+        for item in rankings:
+            if item.cartoon_path in existing_paths:
+                cards.append((item, item.cartoon_path))
+            else:
+                cards.append((item, item.image_path if item.image_path in existing_paths else None))
+        
+        for row_start in range(0, len(cards), GRID_COLUMNS):
+            cols = st.columns(GRID_COLUMNS)
+            for j, (item, display_path) in enumerate(cards[row_start:row_start + GRID_COLUMNS]):
+                i = row_start + j
+                with cols[j]:
+                    st.markdown(f"**#{i+1}** · {item.timestamp} · 评分: {item.score:.3f}")
+                    
+                    if display_path:
+                        st.markdown('<div class="image-card">', unsafe_allow_html=True)
+                        shown = _show_image(display_path, existing_paths[display_path], use_container_width=True)
+                        st.markdown('</div>', unsafe_allow_html=True)
+                    else:
+                        shown = False
+                    if not shown:
+                        st.info("图片不可用")
+        
+        # 统一的删除控件（替代每张卡片一个删除按钮）
+        with st.form("delete_form"):
+            idx = st.selectbox(
+                "删除精选",
+                options=list(range(1, len(rankings) + 1)),
+                format_func=lambda n: f"#{n} · {rankings[n-1].timestamp} · 评分: {rankings[n-1].score:.3f}"
+            )
+            if st.form_submit_button("删除选中", use_container_width=True):
+                ranking_manager.remove_image(rankings[idx-1].image_path)
+                add_log(f"🗑️ 已删除精选照片 #{idx}")
+                st.rerun()
     else:
         st.info("今日暂无精选照片，点击「立即抓拍测试」开始捕捉精彩瞬间。")
     st.markdown("</div>", unsafe_allow_html=True)
     
     # 预览最新拼图
-    collage_dir = Path(__file__).parent / "data" / "collages"
-    today_collage = collage_dir / f"collage_{date.today().isoformat()}.jpg"
+    today_collage = _today_collage_path(date.today().isoformat())
     
-    if today_collage.exists():
+    if today_collage:
         st.markdown('<div class="section-card">', unsafe_allow_html=True)
         st.subheader("今日连环画预览")
         
         col1, col2, col3 = st.columns([1, 2, 1])
         with col2:
-            st.image(str(today_collage), caption="今日家庭漫画连环画", use_container_width=True)
+            if not _show_image(*today_collage, caption="今日家庭漫画连环画", use_container_width=True):
+                st.info("连环画不可用")
         st.markdown("</div>", unsafe_allow_html=True)
     
 
@@ -1383,19 +1889,30 @@ def render_main():
 # ========== 主函数 ==========
 def main():
     """主函数"""
+    inject_styles()
     init_session_state()
     start_scheduler_if_needed()
     if not render_auth_gate():
         return
 
+    st.session_state.in_full_run = True
     render_sidebar()
     render_main()
-    
-    # 自动刷新逻辑
-    if st.session_state.get('auto_refresh', False):
-        import time
-        time.sleep(2)
-        st.rerun()
+    # 记录整页渲染完成时的日志序号，日志片段据此判断是否需要整页刷新
+    state = get_global_state()
+    state.log_buffer.flush()
+    st.session_state.page_log_seq = state.log_seq
+    st.session_state.in_full_run = False
+    
+    # 自动刷新逻辑（不支持 st.fragment 的旧版 Streamlit 整页刷新）
+    if st.session_state.get('auto_refresh', False) and not FRAGMENT_AVAILABLE:
+        if AUTOREFRESH_AVAILABLE:
+            # 由前端定时触发 rerun，不占用脚本线程
+            st_autorefresh(interval=2000, limit=None, key="auto_log_refresh")
+        else:
+            # 最后的兜底：短暂休眠后整页重跑（不在脚本线程中长时间阻塞等待）
+            time.sleep(2)
+            st.rerun()
 
 
 if __name__ == "__main__":
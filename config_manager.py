@@ -5,11 +5,25 @@
 """
 
 import os
+import atexit
+import types
 import yaml
-from typing import Any, Dict, Optional
+from typing import Any, Dict, Mapping, Optional
 from pathlib import Path
 import threading
 
+# fastrlock 在无竞争时比 threading.RLock 快得多，未安装时回退到标准库实现
+try:
+    from fastrlock.rlock import FastRLock as _RLock
+except ImportError:
+    from threading import RLock as _RLock
+
+# 优先使用 libyaml 的 C 实现（PyYAML 官方 wheel 自带），源码安装时回退到纯 Python 实现
+try:
+    from yaml import CSafeLoader as _YamlLoader, CSafeDumper as _YamlDumper
+except ImportError:
+    from yaml import SafeLoader as _YamlLoader, SafeDumper as _YamlDumper
+
 
 class ConfigManager:
     """
@@ -22,6 +36,9 @@ class ConfigManager:
     - 自动创建默认配置
     """
     
+    # set()/update() 自动保存时的合并写入延迟（秒），连续修改只落盘一次
+    SAVE_DEBOUNCE_SECONDS = 0.5
+    
     # 默认配置模板
     DEFAULT_CONFIG = {
         'rtsp_url': 'rtsp://username:password@ip_address:554/stream',
@@ -37,6 +54,12 @@ class ConfigManager:
         'enable_face_detection': False,
         'auto_capture_enabled': True,
         'auto_push_enabled': True,
+        # 反向代理的 IP 列表：只有来自这些地址的请求才采信 X-Forwarded-For（用于登录限流）
+        'trusted_proxies': [],
+        # 本地 GPU 重绘（需要 diffusers + torch + CUDA），不可用时自动回退到远程接口
+        'use_local_cartoon': False,
+        # 本地模型的文本编码器只理解英文提示词
+        'local_cartoon_prompt': "modern flat vector illustration, bright colors, clean lines, keep the people and background",
         'cartoon_prompt': "现代清新插画风格，矢量艺术，扁平化设计，明亮的色块，简约时尚，色彩鲜艳，充满活力，保留图片中人物和背景的主要特征",
         'scoring_prompt': """作为一名专业摄影评审，请对这张照片进行审美评分。
 
@@ -69,33 +92,51 @@ class ConfigManager:
         
         self.config_path = Path(config_path)
         self._config: Dict[str, Any] = {}
-        self._lock = threading.RLock()  # 可重入锁，保证线程安全
+        self._lock = _RLock()  # 可重入锁，保证线程安全
+        self._snapshot: Optional[Mapping[str, Any]] = None  # 只读快照缓存，配置变更时失效
+        self._mtime_ns: Optional[int] = None  # 最近一次读取/写入时文件的 mtime，未变化时跳过重新解析
+        self._save_timer: Optional[threading.Timer] = None  # 待执行的合并写入
+        self._last_dumped: Optional[bytes] = None  # 最近一次写入文件的内容
+        atexit.register(self.flush)
         
         # 加载配置
         self.load()
     
-    def load(self) -> Dict[str, Any]:
+    def load(self, force: bool = False) -> Dict[str, Any]:
         """
         从 YAML 文件加载配置
         
-        如果配置文件不存在，则创建默认配置
+        如果配置文件不存在，则创建默认配置；文件自上次读取/写入后未被修改时直接返回内存中的配置
+        
+        Args:
+            force: 是否忽略 mtime 强制重新解析
         
         Returns:
             配置字典
         """
         with self._lock:
-            if not self.config_path.exists():
+            # 先落盘尚未写入的修改，避免被文件中的旧值覆盖
+            self.flush()
+            
+            mtime_ns = self._file_mtime_ns()
+            if mtime_ns is None:
                 # 配置文件不存在，创建默认配置
                 self._config = self.DEFAULT_CONFIG.copy()
+                self._snapshot = None
                 self.save(self._config)
                 return self._config
             
+            if not force and self._config and mtime_ns == self._mtime_ns:
+                return self._config
+            
+            self._snapshot = None
             try:
                 with open(self.config_path, 'r', encoding='utf-8') as f:
-                    loaded_config = yaml.safe_load(f) or {}
+                    loaded_config = yaml.load(f, Loader=_YamlLoader) or {}
                 
                 # 合并默认配置（确保所有必需的键都存在）
                 self._config = {**self.DEFAULT_CONFIG, **loaded_config}
+                self._mtime_ns = mtime_ns
                 return self._config
                 
             except yaml.YAMLError as e:
@@ -120,25 +161,70 @@ class ConfigManager:
         with self._lock:
             if config is not None:
                 self._config = config
+                self._snapshot = None
+            
+            # 立即写入，取消待执行的合并写入
+            if self._save_timer is not None:
+                self._save_timer.cancel()
+                self._save_timer = None
             
             try:
+                data = yaml.dump(
+                    self._config, 
+                    Dumper=_YamlDumper,
+                    default_flow_style=False, 
+                    allow_unicode=True,
+                    sort_keys=False
+                ).encode('utf-8')
+                
+                # 内容与上次写入相同且文件未被外部修改时，跳过写盘
+                if data == self._last_dumped and self._file_mtime_ns() == self._mtime_ns:
+                    return True
+                
                 # 确保目录存在
                 self.config_path.parent.mkdir(parents=True, exist_ok=True)
                 
-                with open(self.config_path, 'w', encoding='utf-8') as f:
-                    yaml.dump(
-                        self._config, 
-                        f, 
-                        default_flow_style=False, 
-                        allow_unicode=True,
-                        sort_keys=False
-                    )
+                # 先写临时文件再原子替换，读取方不会看到写了一半的文件
+                tmp_path = self.config_path.with_suffix(self.config_path.suffix + '.tmp')
+                tmp_path.write_bytes(data)
+                os.replace(tmp_path, self.config_path)
+                
+                self._last_dumped = data
+                self._mtime_ns = self._file_mtime_ns()
                 return True
                 
             except Exception as e:
                 print(f"[配置管理] 保存配置失败: {e}")
                 return False
     
+    def _file_mtime_ns(self) -> Optional[int]:
+        """配置文件当前的 mtime，文件不存在时返回 None"""
+        try:
+            return self.config_path.stat().st_mtime_ns
+        except FileNotFoundError:
+            return None
+    
+    def _schedule_save(self):
+        """延迟 SAVE_DEBOUNCE_SECONDS 后写入文件，期间的多次修改合并为一次写入"""
+        with self._lock:
+            if self._save_timer is not None:
+                self._save_timer.cancel()
+            self._save_timer = threading.Timer(self.SAVE_DEBOUNCE_SECONDS, self.flush)
+            self._save_timer.daemon = True
+            self._save_timer.start()
+    
+    def flush(self) -> bool:
+        """
+        立即写入尚未落盘的修改
+        
+        Returns:
+            是否保存成功（没有待写入的修改时返回 True）
+        """
+        with self._lock:
+            if self._save_timer is None:
+                return True
+            return self.save()
+    
     def get(self, key: str, default: Any = None) -> Any:
         """
         获取单项配置值
@@ -150,8 +236,11 @@ class ConfigManager:
         Returns:
             配置值
         """
-        with self._lock:
-            return self._config.get(key, default)
+        # 读路径不加锁：直接读取只读快照，配置变更时快照引用会被整体替换
+        snapshot = self._snapshot
+        if snapshot is None:
+            snapshot = self.snapshot()
+        return snapshot.get(key, default)
     
     def set(self, key: str, value: Any, auto_save: bool = True) -> bool:
         """
@@ -160,44 +249,72 @@ class ConfigManager:
         Args:
             key: 配置项的键名
             value: 配置值
-            auto_save: 是否自动保存到文件
+            auto_save: 是否自动保存到文件（合并写入，SAVE_DEBOUNCE_SECONDS 后落盘）
             
         Returns:
             是否设置成功
         """
         with self._lock:
             self._config[key] = value
+            self._snapshot = None
             
             if auto_save:
-                return self.save()
+                self._schedule_save()
             return True
     
-    def get_all(self) -> Dict[str, Any]:
+    def get_all(self) -> Mapping[str, Any]:
         """
         获取所有配置
         
+        返回只读视图，不再复制字典；需要修改时请使用 get_all_mutable()
+        
+        Returns:
+            配置的只读映射
+        """
+        return self.snapshot()
+    
+    def get_all_mutable(self) -> Dict[str, Any]:
+        """
+        获取所有配置的可修改副本
+        
         Returns:
             配置字典的副本
         """
         with self._lock:
             return self._config.copy()
     
+    def snapshot(self) -> Mapping[str, Any]:
+        """
+        获取配置快照
+        
+        配置未变化时返回同一个只读视图，避免每次调用都复制；
+        快照由所有会话和调度线程共享，只读视图保证调用方无法修改
+        
+        Returns:
+            配置的只读映射
+        """
+        with self._lock:
+            if self._snapshot is None:
+                self._snapshot = types.MappingProxyType(self._config.copy())
+            return self._snapshot
+    
     def update(self, updates: Dict[str, Any], auto_save: bool = True) -> bool:
         """
         批量更新配置
         
         Args:
             updates: 要更新的配置字典
-            auto_save: 是否自动保存到文件
+            auto_save: 是否自动保存到文件（合并写入，SAVE_DEBOUNCE_SECONDS 后落盘）
             
         Returns:
             是否更新成功
         """
         with self._lock:
             self._config.update(updates)
+            self._snapshot = None
             
             if auto_save:
-                return self.save()
+                self._schedule_save()
             return True
     
     def reset_to_default(self, auto_save: bool = True) -> bool:
@@ -212,6 +329,7 @@ class ConfigManager:
         """
         with self._lock:
             self._config = self.DEFAULT_CONFIG.copy()
+            self._snapshot = None
             
             if auto_save:
                 return self.save()
@@ -278,7 +396,7 @@ def get_config_manager() -> ConfigManager:
 if __name__ == '__main__':
     # 测试代码
     cm = get_config_manager()
-    print("当前配置:", cm.get_all())
+    print("当前配置:", dict(cm.get_all()))
     
     is_valid, errors = cm.validate()
     if not is_valid:
@@ -1,6 +1,7 @@
 
 import asyncio
 import os
+import tempfile
 from config_manager import get_config_manager
 from push_client import get_push_client
 from pathlib import Path
@@ -38,25 +39,21 @@ async def debug_push():
     # Test 3: Large Image Message
     print("\n--- Test 3: Large Image Message ---")
     try:
-        # Create a large dummy image with noise (hard to compress)
-        import numpy as np
-        from PIL import Image
-        
-        # 1080p noise image
-        noise = np.random.randint(0, 255, (1920, 1080, 3), dtype=np.uint8)
-        img = Image.fromarray(noise)
-        
-        img_path = "debug_test_image_large.jpg"
-        img.save(img_path)
-        
-        print(f"Created large image: {os.path.getsize(img_path) / 1024:.2f} KB")
+        # Large dummy image with noise (hard to compress), generated once and reused
+        img_path = os.path.join(tempfile.gettempdir(), "debug_test_image_large.jpg")
+        if not os.path.exists(img_path):
+            import numpy as np
+            from PIL import Image
+            
+            # 1080p noise image
+            noise = np.random.default_rng().integers(0, 256, (1920, 1080, 3), dtype=np.uint8)
+            Image.fromarray(noise).save(img_path)
+            print(f"Created large image: {os.path.getsize(img_path) / 1024:.2f} KB")
+        else:
+            print(f"Reusing large image: {os.path.getsize(img_path) / 1024:.2f} KB")
         
         result = await client.push_image(img_path, "Debug Large Image")
         print(f"Result: {result}")
-        
-        # Cleanup
-        if os.path.exists(img_path):
-            os.remove(img_path)
             
     except Exception as e:
         print(f"Exception: {e}")
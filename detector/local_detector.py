@@ -1,12 +1,51 @@
 
 import os
 import logging
+from typing import Union
+import numpy as np
 from modelscope.hub.snapshot_download import snapshot_download
-from ultralytics import YOLO
+
+try:
+    import onnxruntime as ort
+    ORT_AVAILABLE = True
+except ImportError:
+    ORT_AVAILABLE = False
+
+# Accelerated providers tried before the CPU provider, if the installed build has them
+PREFERRED_PROVIDERS = ['OpenVINOExecutionProvider', 'DmlExecutionProvider']
+
+# Minimum face confidence (same as Ultralytics' default conf)
+CONF_THRESHOLD = 0.25
+
+MODEL_REPO = 'qianliyx/yolov8s-facedet'
+MODEL_FILE = 'pytorch_model.onnx'
+# Statically quantized copy produced by detector/quantize_face_model.py (optional)
+INT8_MODEL_FILE = 'pytorch_model.int8.onnx'
+
+
+def preprocess_frame(frame: np.ndarray, size: int) -> np.ndarray:
+    """Letterbox a BGR frame to size x size and pack it as NCHW float32 RGB."""
+    import cv2
+
+    h, w = frame.shape[:2]
+    ratio = min(size / h, size / w)
+    new_h, new_w = round(h * ratio), round(w * ratio)
+    resized = cv2.resize(frame, (new_w, new_h), interpolation=cv2.INTER_LINEAR)
+    top = (size - new_h) // 2
+    left = (size - new_w) // 2
+    padded = cv2.copyMakeBorder(
+        resized, top, size - new_h - top, left, size - new_w - left,
+        cv2.BORDER_CONSTANT, value=(114, 114, 114)
+    )
+    return cv2.dnn.blobFromImage(padded, 1 / 255.0, swapRB=True)
+
 
 class FaceDetector:
     _instance = None
     _model = None
+    _session = None
+    _input_name = None
+    _input_size = 640
 
     @classmethod
     def get_instance(cls):
@@ -15,55 +54,109 @@ class FaceDetector:
         return cls._instance
 
     def __init__(self):
-        print("[FaceDetector] Initializing Face Detector (Ultralytics + ModelScope)...")
+        print("[FaceDetector] Initializing Face Detector (ONNX Runtime + ModelScope)...")
         try:
             # 1. Download model weights from ModelScope
             # This handles caching automatically
             print("[FaceDetector] Downloading/Checking model weights...")
-            model_dir = snapshot_download('qianliyx/yolov8s-facedet')
+            model_dir = snapshot_download(MODEL_REPO)
             # The repo contains pytorch_model.onnx
-            model_path = os.path.join(model_dir, 'pytorch_model.onnx')
-            
-            # 2. Load model using Ultralytics
-            # Ultralytics supports loading ONNX models directly
+            model_path = os.path.join(model_dir, MODEL_FILE)
+
+            # 2. Load model
+            # Run the ONNX graph directly with ONNX Runtime; fall back to
+            # Ultralytics (which pulls in torch) only if that is not possible
             print(f"[FaceDetector] Loading model from {model_path}...")
-            self._model = YOLO(model_path)
-            
+            if ORT_AVAILABLE:
+                # Prefer the INT8 model if it has been built (VNNI / ARM dot-product convs)
+                int8_path = os.path.join(model_dir, INT8_MODEL_FILE)
+                if os.path.exists(int8_path):
+                    print(f"[FaceDetector] Using INT8 model {int8_path}")
+                    self._session = self._create_session(int8_path)
+                if self._session is None:
+                    self._session = self._create_session(model_path)
+            if self._session is None:
+                from ultralytics import YOLO
+                self._model = YOLO(model_path)
+
             print("[FaceDetector] Model loaded successfully.")
         except Exception as e:
             print(f"[FaceDetector] Failed to load model: {e}")
             self._model = None
+            self._session = None
+
+    def _create_session(self, model_path: str):
+        """Create an ONNX Runtime session with full graph optimization."""
+        try:
+            opts = ort.SessionOptions()
+            opts.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+            opts.intra_op_num_threads = max(1, (os.cpu_count() or 2) // 2)
 
-    def detect_faces(self, image_path: str) -> bool:
+            available = ort.get_available_providers()
+            providers = [p for p in PREFERRED_PROVIDERS if p in available] + ['CPUExecutionProvider']
+            session = ort.InferenceSession(model_path, sess_options=opts, providers=providers)
+
+            model_input = session.get_inputs()[0]
+            self._input_name = model_input.name
+            # Static exports carry the input size; dynamic ones use the training size
+            if len(model_input.shape) == 4 and isinstance(model_input.shape[2], int):
+                self._input_size = model_input.shape[2]
+
+            print(f"[FaceDetector] ONNX Runtime providers: {session.get_providers()}")
+            return session
+        except Exception as e:
+            print(f"[FaceDetector] ONNX Runtime unavailable for this model: {e}")
+            return None
+
+    def _has_face_onnx(self, image: Union[str, np.ndarray]) -> bool:
+        """Run the ONNX graph and check whether any anchor exceeds CONF_THRESHOLD."""
+        import cv2
+
+        frame = cv2.imread(image) if isinstance(image, str) else image
+        if frame is None:
+            raise ValueError("failed to read image")
+
+        preds = self._session.run(None, {self._input_name: preprocess_frame(frame, self._input_size)})[0]
+        return bool(self._best_scores(preds)[0] >= CONF_THRESHOLD)
+
+    @staticmethod
+    def _best_scores(preds: np.ndarray) -> np.ndarray:
+        """Best face confidence per image of a raw YOLOv8 output batch."""
+        # YOLOv8 output is (batch, 4 + classes [+ keypoints], anchors); some exports are transposed
+        if preds.shape[1] > preds.shape[2]:
+            preds = preds.transpose(0, 2, 1)
+        # We only need presence, so the best face score is enough -- no NMS required
+        return preds[:, 4].max(axis=1)
+
+    def detect_faces(self, image: Union[str, np.ndarray]) -> bool:
         """
         Detect if there are faces in the image.
+        Accepts an image path or an already-decoded BGR frame.
         Returns True if at least one face is detected.
         """
-        if not self._model:
+        name = os.path.basename(image) if isinstance(image, str) else "frame"
+
+        if self._session is None and not self._model:
             print("[FaceDetector] Model not initialized. Skipping detection (assuming True).")
             return True
 
         try:
-            # Ultralytics inference
-            # verbose=False to reduce log noise
-            results = self._model(image_path, verbose=False)
-            
-            if results and len(results) > 0:
-                # Check for detected boxes
+            if self._session is not None:
+                found = self._has_face_onnx(image)
+            else:
+                # Ultralytics inference
+                # verbose=False to reduce log noise
+                # max_det=1: we only need to know whether any face exists,
+                # so NMS can stop after the first kept box
+                results = self._model(image, verbose=False, max_det=1)
                 # results[0].boxes is the Boxes object
-                boxes = results[0].boxes
-                
-                if boxes and len(boxes) > 0:
-                    # Filter by confidence if needed (default usually reasonable)
-                    # Let's count high confidence faces
-                    # confs = boxes.conf
-                    # count = sum(1 for c in confs if c > 0.5)
-                    
-                    count = len(boxes)
-                    print(f"[FaceDetector] Detected {count} faces in {os.path.basename(image_path)}")
-                    return True
-            
-            print(f"[FaceDetector] No face detected in {os.path.basename(image_path)}")
+                found = bool(results and len(results) > 0 and results[0].boxes and len(results[0].boxes) > 0)
+
+            if found:
+                print(f"[FaceDetector] Face detected in {name}")
+                return True
+
+            print(f"[FaceDetector] No face detected in {name}")
             return False
 
         except Exception as e:
@@ -0,0 +1,70 @@
+"""
+Build an INT8 copy of the face detection model with ONNX Runtime static quantization.
+
+Calibrates on real captured frames, so run it once enough captures exist:
+
+    python -m detector.quantize_face_model data/captures [max_frames]
+
+FaceDetector loads the quantized model automatically on its next start.
+"""
+
+import glob
+import os
+import sys
+
+import cv2
+import onnxruntime as ort
+from modelscope.hub.snapshot_download import snapshot_download
+from onnxruntime.quantization import CalibrationDataReader, QuantFormat, QuantType, quantize_static
+
+from detector.local_detector import INT8_MODEL_FILE, MODEL_FILE, MODEL_REPO, preprocess_frame
+
+
+class FrameReader(CalibrationDataReader):
+    """Feeds preprocessed frames to the calibrator one at a time."""
+
+    def __init__(self, paths, input_name: str, input_size: int):
+        self._paths = iter(paths)
+        self._input_name = input_name
+        self._input_size = input_size
+
+    def get_next(self):
+        for path in self._paths:
+            frame = cv2.imread(path)
+            if frame is not None:
+                return {self._input_name: preprocess_frame(frame, self._input_size)}
+        return None
+
+
+def quantize(frames_dir: str, max_frames: int = 200) -> str:
+    """Quantize the face model using up to max_frames images from frames_dir. Returns the output path."""
+    model_dir = snapshot_download(MODEL_REPO)
+    model_path = os.path.join(model_dir, MODEL_FILE)
+    output_path = os.path.join(model_dir, INT8_MODEL_FILE)
+
+    paths = sorted(glob.glob(os.path.join(frames_dir, '*.jpg')))[-max_frames:]
+    if not paths:
+        raise SystemExit(f"[FaceDetector] No calibration frames found in {frames_dir}")
+
+    model_input = ort.InferenceSession(model_path, providers=['CPUExecutionProvider']).get_inputs()[0]
+    input_size = model_input.shape[2] if isinstance(model_input.shape[2], int) else 640
+
+    print(f"[FaceDetector] Calibrating on {len(paths)} frames...")
+    quantize_static(
+        model_input=model_path,
+        model_output=output_path,
+        calibration_data_reader=FrameReader(paths, model_input.name, input_size),
+        quant_format=QuantFormat.QDQ,
+        activation_type=QuantType.QInt8,
+        weight_type=QuantType.QInt8,
+        per_channel=True,
+    )
+    print(f"[FaceDetector] INT8 model written to {output_path}")
+    return output_path
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2:
+        print(__doc__)
+        sys.exit(1)
+    quantize(sys.argv[1], int(sys.argv[2]) if len(sys.argv) > 2 else 200)
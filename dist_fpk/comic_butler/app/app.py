@@ -17,6 +17,7 @@ from datetime import datetime, date
 from pathlib import Path
 import threading
 import time
+from typing import List, Optional
 
 # 添加项目路径
 sys.path.insert(0, str(Path(__file__).parent))
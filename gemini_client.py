@@ -5,26 +5,158 @@ Gemini 图像分析和生成客户端
 """
 
 import os
+import re
 import asyncio
-import base64
+import threading
+import aiohttp
+from collections import OrderedDict
 from pathlib import Path
-from typing import Optional, Tuple
-import requests
-import time
-import json
-from io import BytesIO
-from image_utils import upload_image_to_imgbb
+from typing import Any, Dict, Optional, Tuple
+from image_utils import release_stale_session, upload_image_to_imgbb_async
+from config_manager import get_config_manager
 
 try:
-    import google.generativeai as genai
-    GENAI_AVAILABLE = True
+    import orjson
+    ORJSON_AVAILABLE = True
 except ImportError:
-    GENAI_AVAILABLE = False
-    print("[Gemini] google-generativeai 未安装")
+    ORJSON_AVAILABLE = False
+
+
+# 评分回复中的数字，以及部分思考模型输出的包裹标签
+_SCORE_NUMBER_RE = re.compile(r'0\.\d+|\d+\.?\d*')
+_BOX_TAG_RE = re.compile(r'<\|(?:begin|end)_of_box\|>')
+
+# 单个客户端同时进行的 SiliconFlow 请求数上限（接口有限流）
+SILICONFLOW_CONCURRENCY = 8
+
+# 已上传图片 URL 的缓存条数（同一张图检测、打分、重绘时只上传一次）
+IMGBB_URL_CACHE_SIZE = 32
+
+# 本地 GPU 重绘（use_local_cartoon）使用的图生图模型，需要 diffusers + torch + CUDA
+LOCAL_CARTOON_MODEL = "stabilityai/sdxl-turbo"
+LOCAL_CARTOON_SIZE = 512  # SDXL-Turbo 的训练分辨率
+
+_local_pipeline = None  # None: 未加载；False: 环境不支持
+_local_pipeline_lock = threading.Lock()
+
+
+def _get_local_pipeline():
+    """懒加载本地图生图管线，缺少 diffusers/torch 或 GPU 时返回 None（只检查一次）"""
+    global _local_pipeline
+    if _local_pipeline is None:
+        try:
+            import torch
+            from diffusers import AutoPipelineForImage2Image
+        except ImportError:
+            print("[AI] 未安装 diffusers/torch，无法使用本地重绘")
+            _local_pipeline = False
+            return None
+        if not torch.cuda.is_available():
+            print("[AI] 未检测到 CUDA GPU，无法使用本地重绘")
+            _local_pipeline = False
+            return None
+        print(f"[AI] 正在加载本地重绘模型: {LOCAL_CARTOON_MODEL}...")
+        try:
+            _local_pipeline = AutoPipelineForImage2Image.from_pretrained(
+                LOCAL_CARTOON_MODEL, torch_dtype=torch.float16, variant="fp16"
+            ).to("cuda")
+        except Exception as e:
+            # 下载失败、显存不足等：标记为不可用，避免之后每次重绘都重试加载数 GB 的模型
+            print(f"[AI] 本地重绘模型加载失败: {e}")
+            _local_pipeline = False
+            return None
+    return _local_pipeline or None
+
+
+def _local_cartoon(image_path: str, output_path: str, prompt: str) -> bool:
+    """
+    使用本地 SDXL-Turbo 进行图生图重绘（阻塞，需在线程中调用）
+    
+    Returns:
+        是否成功；环境不支持时返回 False，由调用方回退到远程接口
+    """
+    from PIL import Image
+    
+    # GPU 推理串行执行，同时保护管线的懒加载
+    with _local_pipeline_lock:
+        pipe = _get_local_pipeline()
+        if pipe is None:
+            return False
+        with Image.open(image_path) as source:
+            init_image = source.convert("RGB").resize(
+                (LOCAL_CARTOON_SIZE, LOCAL_CARTOON_SIZE), Image.Resampling.LANCZOS
+            )
+        # Turbo 模型无需 CFG；steps * strength >= 1 才会实际去噪
+        result = pipe(prompt=prompt, image=init_image, num_inference_steps=2,
+                      strength=0.6, guidance_scale=0.0).images[0]
+    Path(output_path).parent.mkdir(parents=True, exist_ok=True)
+    result.save(output_path, 'JPEG', quality=95)
+    return True
+
+
+# 本地卡通化时求颜色聚类中心所用采样图的最长边（像素）
+KMEANS_SAMPLE_EDGE = 512
+
+
+def _nearest_center_labels(img, centers):
+    """
+    计算 BGR 图像每个像素最近的聚类中心下标
+    
+    分块计算距离，临时数组大小与图片分辨率无关
+    
+    Returns:
+        与图像同尺寸的 uint8 下标图
+    """
+    import numpy as np
+    
+    pixels = img.reshape((-1, 3))
+    centers = centers.astype(np.float32)
+    labels = np.empty(len(pixels), dtype=np.uint8)
+    chunk = 1 << 17
+    for start in range(0, len(pixels), chunk):
+        block = pixels[start:start + chunk].astype(np.float32)
+        dists = ((block[:, None, :] - centers[None, :, :]) ** 2).sum(axis=2)
+        labels[start:start + chunk] = dists.argmin(axis=1)
+    return labels.reshape(img.shape[:2])
+
+
+# 文件头标识 -> 对应的扩展名
+_IMAGE_SIGNATURES = {
+    b'\xff\xd8\xff': ('.jpg', '.jpeg'),
+    b'\x89PNG\r\n\x1a\n': ('.png',),
+}
+
+
+# 下载生成图片时每次读取的块大小
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
 
-from PIL import Image
-import io
-from config_manager import get_config_manager
+
+def _finalize_download(part_path: Path, output_path: str):
+    """
+    将下载完成的临时文件转为最终图片
+    
+    格式与输出扩展名一致且无需转换颜色模式时直接重命名，
+    避免一次解码 + 重新编码（对 JPEG 还会造成二次有损压缩）
+    """
+    from PIL import Image
+    
+    suffix = Path(output_path).suffix.lower()
+    with open(part_path, 'rb') as f:
+        header = f.read(8)
+    
+    # Image.open 只解析文件头，用来确认颜色模式
+    with Image.open(part_path) as image:
+        for signature, suffixes in _IMAGE_SIGNATURES.items():
+            if header.startswith(signature) and suffix in suffixes and image.mode not in ('RGBA', 'P'):
+                break
+        else:
+            if image.mode in ('RGBA', 'P'):
+                image = image.convert('RGB')
+            image.save(output_path)
+            part_path.unlink(missing_ok=True)
+            return
+    
+    os.replace(part_path, output_path)
 
 
 class GeminiImageClient:
@@ -45,8 +177,96 @@ class GeminiImageClient:
             token: SiliconFlow API Token
         """
         self.token = token
+        # 复用 aiohttp 连接池（keep-alive），避免每次请求重新握手，也不阻塞事件循环
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._session_loop: Optional[asyncio.AbstractEventLoop] = None
+        self._request_sem: Optional[asyncio.Semaphore] = None
+        # ImgBB URL 缓存，键为 (路径, mtime, 大小)，文件被覆盖后自然失效
+        self._url_cache: "OrderedDict[tuple, str]" = OrderedDict()
+        self._pending_uploads: Dict[tuple, asyncio.Future] = {}
         # self.analysis_model = ... (不再依赖 Gemini SD)
     
+    def _get_headers(self) -> Dict[str, str]:
+        """获取请求头"""
+        return {
+            "Authorization": f"Bearer {self.token}",
+            "Content-Type": "application/json"
+        }
+    
+    async def _get_session(self) -> aiohttp.ClientSession:
+        """获取或创建 aiohttp 会话"""
+        # 会话绑定创建时的事件循环，循环变化时需要重建
+        loop = asyncio.get_running_loop()
+        if self._session is None or self._session.closed or self._session_loop is not loop:
+            stale, stale_loop = self._session, self._session_loop
+            connector = aiohttp.TCPConnector(limit=8, keepalive_timeout=60)
+            self._session = aiohttp.ClientSession(connector=connector)
+            self._session_loop = loop
+            self._request_sem = asyncio.Semaphore(SILICONFLOW_CONCURRENCY)
+            # 新会话就位后再释放旧会话，期间并发调用方不会重复创建
+            await release_stale_session(stale, stale_loop)
+        return self._session
+    
+    async def _post_json(self, url: str, payload: Dict[str, Any], timeout: float) -> Tuple[int, Any]:
+        """
+        POST JSON 请求
+        
+        Returns:
+            (HTTP 状态码, 成功时为解析后的 JSON，失败时为响应文本)
+        """
+        session = await self._get_session()
+        # 优先使用 orjson 序列化/解析（请求头已声明 application/json）
+        if ORJSON_AVAILABLE:
+            body = {'data': orjson.dumps(payload)}
+        else:
+            body = {'json': payload}
+        async with self._request_sem:
+            async with session.post(url, headers=self._get_headers(),
+                                    timeout=aiohttp.ClientTimeout(total=timeout), **body) as resp:
+                if resp.status != 200:
+                    return resp.status, await resp.text()
+                if ORJSON_AVAILABLE:
+                    return resp.status, orjson.loads(await resp.read())
+                return resp.status, await resp.json(content_type=None)
+    
+    async def _upload_image(self, image_path: str, imgbb_key: str) -> Optional[str]:
+        """
+        上传图片到 ImgBB 并返回 URL
+        
+        同一文件只上传一次：命中缓存直接返回，正在上传时等待同一个上传任务
+        """
+        try:
+            stat = os.stat(image_path)
+        except OSError:
+            return None
+        key = (image_path, stat.st_mtime_ns, stat.st_size)
+        
+        url = self._url_cache.get(key)
+        if url is not None:
+            self._url_cache.move_to_end(key)
+            return url
+        
+        session = await self._get_session()
+        pending = self._pending_uploads.get(key)
+        if pending is None:
+            # 复用本客户端的 aiohttp 会话上传，不占用线程
+            pending = asyncio.ensure_future(upload_image_to_imgbb_async(session, image_path, imgbb_key))
+            self._pending_uploads[key] = pending
+            pending.add_done_callback(lambda _: self._pending_uploads.pop(key, None))
+        
+        # shield：某个调用方被取消时不影响其他等待同一上传的调用方
+        url = await asyncio.shield(pending)
+        if url:
+            self._url_cache[key] = url
+            while len(self._url_cache) > IMGBB_URL_CACHE_SIZE:
+                self._url_cache.popitem(last=False)
+        return url
+    
+    async def close(self):
+        """关闭会话"""
+        if self._session and not self._session.closed:
+            await self._session.close()
+    
     async def classify_image(self, image_path: str) -> Tuple[bool, str, float]:
         """
         检测图片中是否有人物
@@ -57,14 +277,10 @@ class GeminiImageClient:
         Returns:
             (是否有人物, 标签, 置信度)
         """
-        if not GENAI_AVAILABLE:
-            print("[Gemini] google-generativeai 未安装")
-            return True, "person", 0.9  # 默认返回有人
-        
         try:
             print(f"[AI] 正在分析图片: {Path(image_path).name}")
             
-            config = get_config_manager()
+            config = get_config_manager().snapshot()  # 本次调用内只读取一次配置
             imgbb_key = config.get('imgbb_api_key', '')
             model = config.get('scoring_model', 'THUDM/GLM-4.1V-9B-Thinking') # 复用评分模型
             
@@ -72,19 +288,13 @@ class GeminiImageClient:
                 # 如果没有 Token，默认返回 True (让后续流程处理)
                 return True, "unknown", 0.5
 
-            # 1. 上传图片 (如果已经在 score_image 上传过就好，但在检测阶段可能还没上传)
-            # 这里为了简单，再次调用 imgbb (或者优化一下流程？)
-            # 实际上 app.py 流程是 classify -> score. 
-            img_url = upload_image_to_imgbb(image_path, imgbb_key)
+            # 1. 上传图片（与 score_image / cartoon_image 共用 URL 缓存，同一张图只上传一次）
+            img_url = await self._upload_image(image_path, imgbb_key)
             if not img_url:
                 return True, "unknown", 0.5
             
             # 2. 调用 API
             url = "https://api.siliconflow.cn/v1/chat/completions"
-            headers = {
-                "Authorization": f"Bearer {self.token}",
-                "Content-Type": "application/json"
-            }
             
             payload = {
                 "model": model,
@@ -99,13 +309,13 @@ class GeminiImageClient:
                 "max_tokens": 10
             }
             
-            response = requests.post(url, headers=headers, json=payload, timeout=30)
+            status, body = await self._post_json(url, payload, timeout=30)
             
-            if response.status_code != 200:
-                print(f"[AI] 检测API失败: {response.text}")
+            if status != 200:
+                print(f"[AI] 检测API失败: {body}")
                 return True, "unknown", 0.5
                 
-            content = response.json()['choices'][0]['message']['content'].lower()
+            content = body['choices'][0]['message']['content'].lower()
             has_person = "yes" in content or "是" in content
             
             return has_person, "person" if has_person else "background", 0.8 if has_person else 0.2
@@ -129,7 +339,7 @@ class GeminiImageClient:
         try:
             print(f"[AI] 正在评分: {Path(image_path).name}")
             
-            config = get_config_manager()
+            config = get_config_manager().snapshot()  # 本次调用内只读取一次配置
             imgbb_key = config.get('imgbb_api_key', '')
             model = config.get('scoring_model', 'THUDM/GLM-4.1V-9B-Thinking')
             
@@ -143,17 +353,13 @@ class GeminiImageClient:
                 return round(random.uniform(0.5, 0.9), 3)
 
             # 1. 上传图片到 ImgBB
-            img_url = upload_image_to_imgbb(image_path, imgbb_key)
+            img_url = await self._upload_image(image_path, imgbb_key)
             if not img_url:
                 print("[AI] 图片上传失败，无法评分")
                 return 0.6
                 
             # 2. 调用 Chat Completions API
             url = "https://api.siliconflow.cn/v1/chat/completions"
-            headers = {
-                "Authorization": f"Bearer {self.token}",
-                "Content-Type": "application/json"
-            }
             
             prompt = config.get('scoring_prompt', """作为一名专业摄影评审，请对这张照片进行审美评分。
                     
@@ -180,36 +386,28 @@ class GeminiImageClient:
                 "stream": False
             }
             
-            response = requests.post(url, headers=headers, json=payload, timeout=60)
+            status, result = await self._post_json(url, payload, timeout=60)
             
-            if response.status_code != 200:
-                print(f"[AI] 评分API请求失败: {response.text}")
+            if status != 200:
+                print(f"[AI] 评分API请求失败: {result}")
                 return 0.6
                 
-            result = response.json()
             content = result['choices'][0]['message']['content']
             # 清理可能存在的 Model Thinking 标签
-            content = content.replace('<|begin_of_box|>', '').replace('<|end_of_box|>', '')
+            content = _BOX_TAG_RE.sub('', content)
             print(f"[AI] 原始响应内容: {content}")
             
-            # 3. 解析评分
-            import re
-            numbers = re.findall(r'0\.\d+|\d+\.?\d*', content)
-            
+            # 3. 解析评分：找到第一个合理的数字即停止扫描
             score = 0.6
-            if numbers:
+            for match in _SCORE_NUMBER_RE.finditer(content):
+                val = float(match.group())
                 # 尝试找到看起来像 0-1 之间的小数
-                for num_str in numbers:
-                    try:
-                        val = float(num_str)
-                        if 0 <= val <= 1:
-                            score = val
-                            break
-                        elif 1 < val <= 100: # 如果是百分制
-                             score = val / 100
-                             break
-                    except:
-                        continue
+                if 0 <= val <= 1:
+                    score = val
+                    break
+                elif 1 < val <= 100: # 如果是百分制
+                    score = val / 100
+                    break
             
             print(f"[AI] 审美评分: {score:.3f} (Model: {model})")
             return score
@@ -225,10 +423,21 @@ class GeminiImageClient:
         """
         try:
             # 读取配置
-            config = get_config_manager()
+            config = get_config_manager().snapshot()  # 本次调用内只读取一次配置
             imgbb_key = config.get('imgbb_api_key', '')
             model = config.get('cartoon_model', 'Kwai-Kolors/Kolors')
             
+            # 0. 启用本地重绘时优先在本机 GPU 上生成，省去上传和远程调用
+            if config.get('use_local_cartoon', False):
+                print(f"[AI] 正在本地重绘: {Path(image_path).name}...")
+                try:
+                    if await asyncio.to_thread(_local_cartoon, image_path, output_path,
+                                               config.get('local_cartoon_prompt', '')):
+                        return True, ""
+                except Exception as e:
+                    print(f"[AI] 本地重绘失败: {e}")
+                print("[AI] 本地重绘不可用，改用远程接口")
+            
             if not self.token:
                 return False, "未配置 SiliconFlow Token"
             if not imgbb_key:
@@ -236,17 +445,13 @@ class GeminiImageClient:
 
             # 1. 上传图片到 ImgBB 获取 URL
             print(f"[AI] 正在上传图片: {Path(image_path).name}...")
-            img_url = upload_image_to_imgbb(image_path, imgbb_key)
+            img_url = await self._upload_image(image_path, imgbb_key)
             if not img_url:
                 return False, "ImgBB 上传失败"
 
             # 2. 调用 SiliconFlow Image Generation API
             print(f"[AI] 正在调用重绘模型: {model}...")
             url = "https://api.siliconflow.cn/v1/images/generations"
-            headers = {
-                "Authorization": f"Bearer {self.token}",
-                "Content-Type": "application/json"
-            }
             
             prompt = config.get('cartoon_prompt', "变成日系动漫风格，保持人物特征")
             
@@ -261,33 +466,32 @@ class GeminiImageClient:
             # 针对 Kolors 的特殊处理（如果 Kolors 不支持 I2I，这可能会失败或变成 T2I）
             # 但用户指定 Kolors 作为重绘模型，我们尝试传 image 参数。
             
-            response = requests.post(
-                url,
-                headers=headers,
-                data=json.dumps(payload),
-                timeout=120
-            )
+            status, data = await self._post_json(url, payload, timeout=120)
             
-            if response.status_code != 200:
-                print(f"[AI] 重绘API失败: {response.text}")
-                return False, f"API请求失败: {response.text}"
+            if status != 200:
+                print(f"[AI] 重绘API失败: {data}")
+                return False, f"API请求失败: {data}"
                 
-            data = response.json()
             if 'data' in data and len(data['data']) > 0:
                 output_url = data['data'][0]['url']
                 print(f"[AI] 生成成功，下载图片: {output_url}")
                 
                  # 4. 下载并保存结果
-                img_res = requests.get(output_url, timeout=30)
-                if img_res.status_code == 200:
-                    image = Image.open(BytesIO(img_res.content))
-                    if image.mode in ('RGBA', 'P'):
-                        image = image.convert('RGB')
-                    Path(output_path).parent.mkdir(parents=True, exist_ok=True)
-                    image.save(output_path)
+                # 分块写入同目录的临时文件，不在内存中缓存整张图片
+                session = await self._get_session()
+                Path(output_path).parent.mkdir(parents=True, exist_ok=True)
+                part_path = Path(output_path + '.part')
+                try:
+                    async with session.get(output_url, timeout=aiohttp.ClientTimeout(total=30)) as img_res:
+                        if img_res.status != 200:
+                            return False, "下载生成图片失败"
+                        with open(part_path, 'wb') as f:
+                            async for chunk in img_res.content.iter_chunked(DOWNLOAD_CHUNK_SIZE):
+                                f.write(chunk)
+                    await asyncio.to_thread(_finalize_download, part_path, output_path)
                     return True, ""
-                else:
-                    return False, "下载生成图片失败"
+                finally:
+                    part_path.unlink(missing_ok=True)
             
             return False, "API未返回图片数据"
 
@@ -329,23 +533,30 @@ class GeminiImageClient:
             )
             
             # 4. 颜色量化 - 减少颜色数量
-            data = np.float32(img.reshape((-1, 3)))
+            # 在缩小后的图上求聚类中心，再把原图像素分配到最近的中心
+            h, w = img.shape[:2]
+            scale = KMEANS_SAMPLE_EDGE / max(h, w)
+            sample = cv2.resize(img, (max(1, int(w * scale)), max(1, int(h * scale))),
+                                interpolation=cv2.INTER_AREA) if scale < 1 else img
             criteria = (cv2.TERM_CRITERIA_EPS + cv2.TERM_CRITERIA_MAX_ITER, 20, 1.0)
-            _, labels, centers = cv2.kmeans(data, 16, None, criteria, 10, cv2.KMEANS_RANDOM_CENTERS)
-            centers = np.uint8(centers)
-            quantized = centers[labels.flatten()].reshape(img.shape)
+            # 颜色量化对初始中心不敏感，k-means++ 初始化跑一次即可
+            _, _, centers = cv2.kmeans(np.float32(sample.reshape((-1, 3))), 16, None,
+                                       criteria, 1, cv2.KMEANS_PP_CENTERS)
+            labels = _nearest_center_labels(img, centers)
             
             # 5. 调整为暖色调（吉卜力风格）
-            # 增加橙色/黄色调
-            hsv = cv2.cvtColor(quantized, cv2.COLOR_BGR2HSV)
-            hsv[:, :, 0] = np.clip(hsv[:, :, 0].astype(np.int32) - 5, 0, 179).astype(np.uint8)  # 色相偏暖
-            hsv[:, :, 1] = np.clip(hsv[:, :, 1] * 1.1, 0, 255).astype(np.uint8)  # 饱和度
-            hsv[:, :, 2] = np.clip(hsv[:, :, 2] * 1.05, 0, 255).astype(np.uint8)  # 亮度
-            warm = cv2.cvtColor(hsv, cv2.COLOR_HSV2BGR)
-            
-            # 6. 合并边缘
-            edges_colored = cv2.cvtColor(edges, cv2.COLOR_GRAY2BGR)
-            cartoon = cv2.bitwise_and(warm, edges_colored)
+            # 量化后只有 16 种颜色，直接对调色板做色调调整，无需整图往返 HSV
+            # 增加橙色/黄色调；OpenCV 饱和运算直接在 uint8 上完成，无需升位和 clip
+            palette = np.clip(centers, 0, 255).astype(np.uint8).reshape((-1, 1, 3))
+            hue, sat, val = cv2.split(cv2.cvtColor(palette, cv2.COLOR_BGR2HSV))
+            hue = cv2.subtract(hue, 5)  # 色相偏暖
+            sat = cv2.convertScaleAbs(sat, alpha=1.1)  # 饱和度
+            val = cv2.convertScaleAbs(val, alpha=1.05)  # 亮度
+            warm_palette = cv2.cvtColor(cv2.merge((hue, sat, val)), cv2.COLOR_HSV2BGR).reshape((-1, 3))
+            warm = warm_palette[labels]
+            
+            # 6. 合并边缘（边缘图直接作为掩码，省去转三通道）
+            cartoon = cv2.bitwise_and(warm, warm, mask=edges)
             
             # 7. 轻微模糊使边缘更柔和
             cartoon = cv2.GaussianBlur(cartoon, (3, 3), 0)
@@ -361,10 +572,6 @@ class GeminiImageClient:
         except Exception as e:
             print(f"[OpenCV] 本地处理失败: {e}")
             return False
-    
-    async def close(self):
-        """关闭客户端"""
-        pass
 
 
 def get_gemini_client(token: str) -> Optional[GeminiImageClient]:
@@ -385,4 +592,3 @@ def get_gemini_client(token: str) -> Optional[GeminiImageClient]:
 if __name__ == '__main__':
     # 测试代码
     print("[Gemini] 模块加载成功")
-    print(f"[Gemini] google-generativeai 可用: {GENAI_AVAILABLE}")
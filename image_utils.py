@@ -5,20 +5,52 @@
 """
 
 import os
+import math
+import functools
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
 from pathlib import Path
 from typing import List, Optional, Tuple, Union
 from PIL import Image, ImageDraw, ImageFont
+import cv2
+import numpy as np
 import io
-import requests
+import threading
+import aiohttp
+import asyncio
 import base64
 
 
+# 按优先级排列的系统字体路径
+FONT_PATHS = [
+    "C:/Windows/Fonts/msyh.ttc",      # 微软雅黑
+    "C:/Windows/Fonts/simhei.ttf",     # 黑体
+    "C:/Windows/Fonts/simsun.ttc",     # 宋体
+    "/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf",  # Linux
+    "/System/Library/Fonts/PingFang.ttc",  # macOS
+]
+
+
+@functools.lru_cache(maxsize=1)
+def _resolve_font_path() -> Optional[str]:
+    """返回第一个可加载的系统字体路径（每个进程只探测一次）"""
+    for font_path in FONT_PATHS:
+        try:
+            if os.path.exists(font_path):
+                ImageFont.truetype(font_path, 12)
+                return font_path
+        except Exception:
+            continue
+    return None
+
+
+@functools.lru_cache(maxsize=32)
 def get_default_font(size: int = 24) -> ImageFont.FreeTypeFont:
     """
     获取默认字体
     
-    尝试加载系统字体，如果失败则使用默认字体
+    尝试加载系统字体，如果失败则使用默认字体；
+    同一字号的字体对象会被缓存，拼图中的多个水印共用一份
     
     Args:
         size: 字体大小
@@ -26,21 +58,9 @@ def get_default_font(size: int = 24) -> ImageFont.FreeTypeFont:
     Returns:
         字体对象
     """
-    # Windows 系统常用中文字体路径
-    font_paths = [
-        "C:/Windows/Fonts/msyh.ttc",      # 微软雅黑
-        "C:/Windows/Fonts/simhei.ttf",     # 黑体
-        "C:/Windows/Fonts/simsun.ttc",     # 宋体
-        "/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf",  # Linux
-        "/System/Library/Fonts/PingFang.ttc",  # macOS
-    ]
-    
-    for font_path in font_paths:
-        try:
-            if os.path.exists(font_path):
-                return ImageFont.truetype(font_path, size)
-        except Exception:
-            continue
+    font_path = _resolve_font_path()
+    if font_path:
+        return ImageFont.truetype(font_path, size)
     
     # 如果都失败，使用默认字体
     try:
@@ -67,17 +87,13 @@ def add_timestamp_watermark(
         opacity: 不透明度（0-255）
         
     Returns:
-        添加水印后的图片
+        添加水印后的图片（RGB/RGBA 图片会被原地修改）
     """
-    # 创建一个透明图层用于绘制水印
-    watermark_layer = Image.new('RGBA', image.size, (0, 0, 0, 0))
-    draw = ImageDraw.Draw(watermark_layer)
-    
     # 获取字体
     font = get_default_font(font_size)
     
     # 获取文本边界框
-    bbox = draw.textbbox((0, 0), timestamp, font=font)
+    bbox = font.getbbox(timestamp)
     text_width = bbox[2] - bbox[0]
     text_height = bbox[3] - bbox[1]
     
@@ -101,23 +117,74 @@ def add_timestamp_watermark(
         x = image.width - text_width - padding
         y = image.height - text_height - padding
     
-    # 绘制半透明背景
+    # 只在文字大小的小图层上绘制，避免分配和混合整幅 RGBA 图层
     bg_padding = 5
+    tile = Image.new('RGBA', (max(text_width, bbox[2]) + bg_padding * 2 + 1,
+                              max(text_height, bbox[3]) + bg_padding * 2 + 1), (0, 0, 0, 0))
+    draw = ImageDraw.Draw(tile)
+    
+    # 绘制半透明背景
     draw.rectangle(
-        [x - bg_padding, y - bg_padding, 
-         x + text_width + bg_padding, y + text_height + bg_padding],
+        [0, 0, text_width + bg_padding * 2, text_height + bg_padding * 2],
         fill=(0, 0, 0, opacity // 2)
     )
     
     # 绘制文字
-    draw.text((x, y), timestamp, font=font, fill=(255, 255, 255, opacity))
+    draw.text((bg_padding, bg_padding), timestamp, font=font, fill=(255, 255, 255, opacity))
+    
+    # 仅混合水印所在区域；不透明图片以图层 alpha 为蒙版粘贴，无需整图转 RGBA
+    dest = (max(0, x - bg_padding), max(0, y - bg_padding))
+    if image.mode == 'RGBA':
+        image.alpha_composite(tile, dest=dest)
+    else:
+        if image.mode != 'RGB':
+            image = image.convert('RGB')
+        image.paste(tile, dest, tile)
+    return image
+
+
+def _fast_resize(img: Image.Image, new_w: int, new_h: int) -> Image.Image:
+    """
+    用 OpenCV 缩放图片（SIMD 内核，比 PIL 的 LANCZOS 快），缩小用 INTER_AREA
+    
+    数组只能表示 L/RGB/RGBA，其余模式（如调色板）先显式转换
+    """
+    if img.mode not in ('L', 'RGB', 'RGBA'):
+        img = img.convert('RGBA' if 'A' in img.getbands() or 'transparency' in img.info else 'RGB')
+    interpolation = cv2.INTER_AREA if new_w < img.width else cv2.INTER_LANCZOS4
+    out = cv2.resize(np.asarray(img), (new_w, new_h), interpolation=interpolation)
+    return Image.fromarray(out)
+
+
+# 拼图时并行处理图片的最大线程数
+COLLAGE_WORKERS = 8
+
+
+def _prepare_collage_image(
+    path: str,
+    timestamp: Optional[str],
+    max_width: int,
+    new_height: int,
+    add_watermarks: bool
+) -> np.ndarray:
+    """
+    解码、缩放并添加水印，返回可直接拼入画布的 RGB 或 RGBA 数组
+    """
+    # 加载图片：只有带透明度的图片才转换为 RGBA，其余保持 RGB（JPEG 无需转换）
+    with Image.open(path) as img:
+        has_alpha = img.mode in ('RGBA', 'LA', 'PA') or 'transparency' in img.info
+        mode = 'RGBA' if has_alpha else 'RGB'
+        arr = np.asarray(img if img.mode == mode else img.convert(mode))
     
-    # 合并图层
-    if image.mode != 'RGBA':
-        image = image.convert('RGBA')
+    scale = max_width / arr.shape[1]
+    interpolation = cv2.INTER_AREA if scale < 1 else cv2.INTER_LANCZOS4
+    arr = cv2.resize(arr, (max_width, new_height), interpolation=interpolation)
     
-    result = Image.alpha_composite(image, watermark_layer)
-    return result
+    # 添加时间水印
+    if add_watermarks and timestamp:
+        arr = np.asarray(add_timestamp_watermark(Image.fromarray(arr), timestamp))
+    
+    return arr
 
 
 def create_comic_collage(
@@ -159,55 +226,65 @@ def create_comic_collage(
     while len(timestamps) < len(image_paths):
         timestamps.append(None)
     
-    # 加载并处理所有图片
-    processed_images = []
+    # 第一遍：只读取文件头中的尺寸，算出缩放后的高度和画布大小
+    layout: List[Tuple[str, Optional[str], int]] = []
     
-    for i, (path, timestamp) in enumerate(zip(image_paths, timestamps)):
+    for path, timestamp in zip(image_paths, timestamps):
         try:
-            # 加载图片
-            img = Image.open(path)
-            
-            # 转换为 RGBA 模式
-            if img.mode != 'RGBA':
-                img = img.convert('RGBA')
-            
+            with Image.open(path) as img:
+                width, height = img.size
             # 计算缩放比例，保持宽度一致
-            scale = max_width / img.width
-            new_height = int(img.height * scale)
-            img = img.resize((max_width, new_height), Image.Resampling.LANCZOS)
-            
-            # 添加时间水印
-            if add_watermarks and timestamp:
-                img = add_timestamp_watermark(img, timestamp)
-            
-            processed_images.append(img)
-            
+            layout.append((path, timestamp, int(height * max_width / width)))
         except Exception as e:
             print(f"[图像处理] 加载图片失败 {path}: {e}")
             continue
     
-    if not processed_images:
+    if not layout:
         print("[图像处理] 没有成功加载任何图片")
         return None
     
     # 计算拼接后的总高度
-    total_height = sum(img.height for img in processed_images)
-    total_height += padding * (len(processed_images) + 1)  # 顶部、底部和图片间的间距
+    total_height = sum(new_height for _, _, new_height in layout)
+    total_height += padding * (len(layout) + 1)  # 顶部、底部和图片间的间距
     
-    # 创建背景画布
-    canvas = Image.new('RGBA', (max_width + padding * 2, total_height), 
-                       (*background_color, 255))
+    # 预分配 RGB 画布
+    canvas = np.empty((total_height, max_width + padding * 2, 3), dtype=np.uint8)
+    canvas[:] = background_color
     
-    # 拼接图片
+    # 第二遍：多线程解码、缩放、加水印（Pillow/OpenCV 的 C 实现会释放 GIL），
+    # 每张的位置已在第一遍确定，哪张先完成就先拼入画布，不必保留全部图片
+    offsets = []
     current_y = padding
-    for img in processed_images:
-        canvas.paste(img, (padding, current_y), img)
-        current_y += img.height + padding
-    
-    # 转换为 RGB 模式（用于保存为 JPEG）
-    final_image = canvas.convert('RGB')
+    for _, _, new_height in layout:
+        offsets.append(current_y)
+        current_y += new_height + padding
+    
+    with ThreadPoolExecutor(max_workers=min(COLLAGE_WORKERS, len(layout))) as executor:
+        futures = {
+            executor.submit(_prepare_collage_image, path, timestamp, max_width, new_height, add_watermarks): i
+            for i, (path, timestamp, new_height) in enumerate(layout)
+        }
+        for future in as_completed(futures):
+            # 取出后即释放对 Future（及其结果数组）的引用（as_completed 也会丢弃已产出的 Future），
+            # 拼入画布后图片即可回收，内存中只保留进行中的几张
+            i = futures.pop(future)
+            path, _, new_height = layout[i]
+            try:
+                arr = future.result()
+            except Exception as e:
+                print(f"[图像处理] 处理图片失败 {path}: {e}")
+                continue
+            
+            # 不透明图片直接切片赋值，带透明度的按 alpha 与背景混合
+            region = canvas[offsets[i]:offsets[i] + new_height, padding:padding + max_width]
+            if arr.shape[2] == 3 or arr[:, :, 3].min() == 255:
+                region[:] = arr[:, :, :3]
+            else:
+                a = arr[:, :, 3:4].astype(np.float32) / 255.0
+                region[:] = (arr[:, :, :3] * a + region * (1.0 - a)).astype(np.uint8)
     
-    return final_image
+    # RGB 模式可直接保存为 JPEG
+    return Image.fromarray(canvas)
 
 
 def save_collage(
@@ -286,6 +363,69 @@ def image_to_base64(image: Union[Image.Image, str], format: str = 'JPEG') -> str
     return f"data:{mime_type};base64,{img_base64}"
 
 
+# 估算 JPEG 质量时的探测质量，以及体积-质量近似关系 size ∝ quality^(1/k) 中的经验指数 k
+JPEG_PROBE_QUALITY = 70
+JPEG_SIZE_EXPONENT = 0.7
+JPEG_MIN_WIDTH = 50  # 压缩到目标体积时允许缩小到的最小宽度
+
+
+# 每个线程复用一个编码缓冲区，试编码时不必反复分配和扩容
+_scratch = threading.local()
+
+
+def _encode_jpeg(image: Image.Image, quality: int) -> bytes:
+    """编码为 JPEG 字节"""
+    buffer = getattr(_scratch, 'buffer', None)
+    if buffer is None:
+        buffer = _scratch.buffer = io.BytesIO()
+    buffer.seek(0)
+    buffer.truncate()
+    image.save(buffer, 'JPEG', quality=quality)
+    with buffer.getbuffer() as view:
+        return bytes(view)
+
+
+def encode_jpeg_to_size(
+    image: Image.Image,
+    max_bytes: int,
+    min_quality: int = 20,
+    max_quality: int = 85
+) -> bytes:
+    """
+    用尽量少的编码次数把 RGB 图片压到目标体积附近
+    
+    先以 JPEG_PROBE_QUALITY 探测一次，按体积-质量的对数线性关系估算目标质量再编码；
+    仍超出时按面积比例逐步缩小重新编码，直到不超过 max_bytes（宽度小于 JPEG_MIN_WIDTH 时停止）。
+    通常 2~3 次编码
+    
+    Args:
+        image: RGB 模式的 PIL Image 对象
+        max_bytes: 目标体积（字节）
+        min_quality: 估算质量的下限
+        max_quality: 估算质量的上限
+        
+    Returns:
+        JPEG 字节
+    """
+    data = _encode_jpeg(image, JPEG_PROBE_QUALITY)
+    estimated = int(JPEG_PROBE_QUALITY * (max_bytes / len(data)) ** JPEG_SIZE_EXPONENT)
+    quality = min(max_quality, max(min_quality, estimated))
+    if quality != JPEG_PROBE_QUALITY:
+        data = _encode_jpeg(image, quality)
+    
+    # 仍超出时缩小尺寸：体积约与像素数成正比，按面积比例估算缩放（每次至少缩小 10%），
+    # 始终从原图缩放，避免反复缩放累积模糊
+    factor = 1.0
+    while len(data) > max_bytes:
+        factor *= min(0.9, math.sqrt(max_bytes / len(data)))
+        new_width = int(image.width * factor)
+        if new_width < JPEG_MIN_WIDTH:
+            break
+        data = _encode_jpeg(_fast_resize(image, new_width, max(1, int(image.height * factor))), quality)
+    
+    return data
+
+
 def compress_image(
     image_path: str,
     max_size_kb: int = 1024,
@@ -315,41 +455,14 @@ def compress_image(
     elif img.mode != 'RGB':
         img = img.convert('RGB')
     
-    # 初始质量
-    quality = 95
+    max_bytes = max_size_kb * 1024
     
-    while quality > 10:
-        buffer = io.BytesIO()
-        img.save(buffer, 'JPEG', quality=quality)
-        size_kb = buffer.tell() / 1024
-        
-        if size_kb <= max_size_kb:
-            # 保存到文件
-            with open(output_path, 'wb') as f:
-                f.write(buffer.getvalue())
-            return output_path
-        
-        quality -= 5
+    # 按体积模型估算质量，仍超出时由 encode_jpeg_to_size 缩小尺寸（通常 2~3 次编码即可）
+    data = encode_jpeg_to_size(img, max_bytes, min_quality=10, max_quality=95)
     
-    # 如果还是太大，缩小尺寸
-    scale = 0.9
-    while scale > 0.1:
-        new_size = (int(img.width * scale), int(img.height * scale))
-        resized = img.resize(new_size, Image.Resampling.LANCZOS)
-        
-        buffer = io.BytesIO()
-        resized.save(buffer, 'JPEG', quality=70)
-        size_kb = buffer.tell() / 1024
-        
-        if size_kb <= max_size_kb:
-            with open(output_path, 'wb') as f:
-                f.write(buffer.getvalue())
-            return output_path
-        
-        scale -= 0.1
-    
-    # 最终保存，不管大小
-    img.save(output_path, 'JPEG', quality=50)
+    # 保存到文件
+    with open(output_path, 'wb') as f:
+        f.write(data)
     return output_path
 
 
@@ -362,13 +475,48 @@ if __name__ == '__main__':
     print(f"[图像处理] 字体加载: {font}")
 
 
-def upload_image_to_imgbb(image_path: str, api_key: str) -> Optional[str]:
+async def release_stale_session(session: Optional[aiohttp.ClientSession],
+                                loop: Optional[asyncio.AbstractEventLoop]) -> None:
     """
-    将图片上传到 ImgBB
+    释放绑定在旧事件循环上的 aiohttp 会话（客户端切换到新循环重建会话前调用）
+    
+    连接属于旧循环：旧循环仍在运行时交给它关闭；已停止时分离并尽力关闭连接器，
+    避免连接器泄漏和 "Unclosed client session" 警告
+    """
+    if session is None or session.closed:
+        return
+    if loop is not None and loop.is_running():
+        asyncio.run_coroutine_threadsafe(session.close(), loop)
+        return
+    connector = session.connector
+    session.detach()
+    if connector is not None:
+        try:
+            result = connector.close()
+            if hasattr(result, '__await__'):  # aiohttp 3.10+ 返回可等待对象
+                await result
+        except Exception:
+            # 旧循环已关闭时无法正常关闭其上的连接，连接器已标记为关闭即可
+            pass
+
+
+IMGBB_UPLOAD_URL = "https://api.imgbb.com/1/upload"
+
+
+async def upload_image_to_imgbb_async(
+    session: aiohttp.ClientSession,
+    image_path: str,
+    api_key: str,
+    timeout: float = 60
+) -> Optional[str]:
+    """
+    将图片上传到 ImgBB（异步版本，复用调用方的 aiohttp 会话，不阻塞事件循环）
     
     Args:
+        session: aiohttp 会话
         image_path: 图片路径
         api_key: ImgBB API Key
+        timeout: 超时时间（秒）
         
     Returns:
         成功时返回图片 URL，失败返回 None
@@ -376,30 +524,30 @@ def upload_image_to_imgbb(image_path: str, api_key: str) -> Optional[str]:
     if not api_key:
         print("[ImgBB] 未配置 API Key，跳过上传")
         return None
-        
+    
     try:
         print(f"[ImgBB] 正在上传: {os.path.basename(image_path)}...")
         
-        with open(image_path, "rb") as file:
-            url = "https://api.imgbb.com/1/upload"
-            payload = {
-                "key": api_key,
-                "image": base64.b64encode(file.read()),
-            }
-            res = requests.post(url, payload)
+        # 读文件放到线程中，避免磁盘 IO 卡住事件循环
+        content = await asyncio.to_thread(Path(image_path).read_bytes)
+        form = aiohttp.FormData()
+        form.add_field('key', api_key)
+        form.add_field('image', content, filename=os.path.basename(image_path), content_type='image/jpeg')
         
-        if res.status_code == 200:
-            data = res.json()
-            if data['success']:
-                img_url = data['data']['url']
-                print(f"[ImgBB] 上传成功: {img_url}")
-                return img_url
+        async with session.post(IMGBB_UPLOAD_URL, data=form,
+                                timeout=aiohttp.ClientTimeout(total=timeout)) as res:
+            if res.status == 200:
+                data = await res.json(content_type=None)
+                if data['success']:
+                    img_url = data['data']['url']
+                    print(f"[ImgBB] 上传成功: {img_url}")
+                    return img_url
+                else:
+                    print(f"[ImgBB] API返回错误: {data}")
             else:
-                print(f"[ImgBB] API返回错误: {data}")
-        else:
-            print(f"[ImgBB] HTTP错误: {res.status_code} - {res.text}")
-            
+                print(f"[ImgBB] HTTP错误: {res.status} - {await res.text()}")
+    
     except Exception as e:
         print(f"[ImgBB] 上传异常: {e}")
-        
+    
     return None
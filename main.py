@@ -13,6 +13,7 @@ import asyncio
 import signal
 import sys
 import os
+import threading
 from datetime import datetime
 from pathlib import Path
 
@@ -32,7 +33,14 @@ from image_utils import create_comic_collage, save_collage
 data_dir = Path(__file__).parent / "data"
 ranking_manager: RankingManager = None
 rtsp_capture = None
-running = True
+_stop_event = threading.Event()  # 收到退出信号时置位
+event_loop: asyncio.AbstractEventLoop = None  # 常驻事件循环，任务共用
+vision_client = None  # 常驻客户端，复用连接池
+push_client = None
+_client_tokens: tuple = None  # 创建客户端时使用的 Token，变化时重建
+
+# 漫画重绘并发数（受 API 限流约束）
+REDRAW_CONCURRENCY = 3
 
 
 def log(message: str):
@@ -41,10 +49,39 @@ def log(message: str):
     print(f"[{timestamp}] {message}")
 
 
+async def _refresh_clients():
+    """
+    配置文件中的 Token 变化时重建客户端（无需重启服务）
+    
+    每次任务开始时调用：load() 仅在文件 mtime 变化时重新解析
+    """
+    global vision_client, push_client, _client_tokens
+    
+    config = get_config_manager()
+    config.load()
+    tokens = (config.get('modelscope_token', ''), config.get('pushplus_token', ''))
+    if tokens == _client_tokens:
+        return
+    
+    stale = [c for c in (vision_client, push_client) if c is not None]
+    vision_client = get_vision_client(tokens[0])
+    push_client = get_push_client(tokens[1])
+    _client_tokens = tokens
+    
+    if stale:
+        log("检测到 Token 变更，已重建客户端")
+    for client in stale:
+        try:
+            await client.close()
+        except Exception as e:
+            log(f"关闭旧客户端失败: {e}")
+
+
 async def capture_task():
     """抓拍任务"""
     global ranking_manager, rtsp_capture
     
+    await _refresh_clients()
     config = get_config_manager()
     
     try:
@@ -58,7 +95,8 @@ async def capture_task():
         
         # 抓拍
         capture_dir = data_dir / "captures"
-        image_path = rtsp_capture.capture_and_save(str(capture_dir))
+        # 阻塞操作放到线程中执行，避免卡住共享事件循环
+        image_path = await asyncio.to_thread(rtsp_capture.capture_and_save, str(capture_dir))
         
         if not image_path:
             log("抓拍失败：无法获取画面")
@@ -66,35 +104,22 @@ async def capture_task():
         
         log(f"抓拍成功: {Path(image_path).name}")
         
-        # 人物检测
-        vision_client = get_vision_client(config.get('modelscope_token', ''))
-        has_person, label, conf = await vision_client.classify_image(image_path)
+        # 人物检测 + 审美打分（无人时跳过打分）
+        has_person, label, conf, score = await vision_client.analyze(image_path)
         
         if not has_person:
             log(f"未检测到人物 (检测到: {label})")
-            try:
-                os.remove(image_path)
-            except:
-                pass
-            await vision_client.close()
+            Path(image_path).unlink(missing_ok=True)
             return
         
         log(f"检测到人物: {label} (置信度: {conf:.2f})")
-        
-        # 审美打分
-        score = await vision_client.score_image(image_path)
         log(f"审美评分: {score:.3f}")
         
-        await vision_client.close()
-        
         # 检查阈值
         threshold = config.get('quality_threshold', 0.5)
         if score < threshold:
             log(f"评分低于阈值 {threshold}，不入选")
-            try:
-                os.remove(image_path)
-            except:
-                pass
+            Path(image_path).unlink(missing_ok=True)
             return
         
         # 加入排名
@@ -110,11 +135,25 @@ async def capture_task():
         log(f"抓拍任务异常: {e}")
 
 
+def _build_and_save_collage(image_paths, timestamps, collage_path: str) -> bool:
+    """生成并保存拼图（阻塞操作，在线程中执行）"""
+    collage = create_comic_collage(image_paths, timestamps)
+    if collage is None:
+        log("拼图生成失败")
+        return False
+    
+    if not save_collage(collage, collage_path):
+        log("保存拼图失败")
+        return False
+    
+    return True
+
+
 async def push_task():
     """推送任务"""
     global ranking_manager
     
-    config = get_config_manager()
+    await _refresh_clients()
     
     try:
         log("开始执行推送任务...")
@@ -124,20 +163,20 @@ async def push_task():
             log("没有可推送的照片")
             return
         
-        # 漫画重绘
-        vision_client = get_vision_client(config.get('modelscope_token', ''))
+        # 漫画重绘：各张照片互不依赖，并发调用重绘接口
         cartoon_dir = data_dir / "cartoons"
+        sem = asyncio.Semaphore(REDRAW_CONCURRENCY)
         
-        for i, item in enumerate(rankings):
+        async def redraw_one(i: int, item):
             if item.cartoon_path and os.path.exists(item.cartoon_path):
-                continue
-            
-            log(f"正在重绘第 {i+1}/{len(rankings)} 张...")
+                return
             
             cartoon_filename = f"cartoon_{Path(item.image_path).stem}.jpg"
             cartoon_path = str(cartoon_dir / cartoon_filename)
             
-            success = await vision_client.cartoon_image(item.image_path, cartoon_path)
+            async with sem:
+                log(f"正在重绘第 {i+1}/{len(rankings)} 张...")
+                success = await vision_client.cartoon_image(item.image_path, cartoon_path)
             
             if success:
                 ranking_manager.update_cartoon_path(item.image_path, cartoon_path)
@@ -145,7 +184,7 @@ async def push_task():
             else:
                 log(f"第 {i+1} 张重绘失败")
         
-        await vision_client.close()
+        await asyncio.gather(*[redraw_one(i, item) for i, item in enumerate(rankings)])
         
         # 创建拼图
         log("正在生成连环画...")
@@ -158,26 +197,19 @@ async def push_task():
         image_paths = [p for p, t in cartoon_data]
         timestamps = [t for p, t in cartoon_data]
         
-        collage = create_comic_collage(image_paths, timestamps)
-        
-        if collage is None:
-            log("拼图生成失败")
-            return
-        
         collage_dir = data_dir / "collages"
         from datetime import date
         collage_filename = f"collage_{date.today().isoformat()}.jpg"
         collage_path = str(collage_dir / collage_filename)
         
-        if not save_collage(collage, collage_path):
-            log("保存拼图失败")
+        # 拼图内部已多线程处理且 OpenCV/Pillow 会释放 GIL，放到线程中即可不卡住事件循环
+        if not await asyncio.to_thread(_build_and_save_collage, image_paths, timestamps, collage_path):
             return
         
         log(f"连环画生成完成: {collage_filename}")
         
         # 推送
         log("正在推送到微信...")
-        push_client = get_push_client(config.get('pushplus_token', ''))
         
         result = await push_client.push_comic_collage(
             collage_path,
@@ -185,8 +217,6 @@ async def push_task():
             photo_count=len(rankings)
         )
         
-        await push_client.close()
-        
         if result.get('code') == 200:
             log("推送成功！")
         else:
@@ -196,26 +226,30 @@ async def push_task():
         log(f"推送任务异常: {e}")
 
 
+def run_in_loop(coro):
+    """在常驻事件循环中执行协程，并阻塞等待结果"""
+    return asyncio.run_coroutine_threadsafe(coro, event_loop).result()
+
+
 def capture_task_sync():
     """同步版抓拍任务（给调度器使用）"""
-    asyncio.run(capture_task())
+    run_in_loop(capture_task())
 
 
 def push_task_sync():
     """同步版推送任务（给调度器使用）"""
-    asyncio.run(push_task())
+    run_in_loop(push_task())
 
 
 def signal_handler(sig, frame):
     """信号处理"""
-    global running
     log("收到退出信号，正在关闭...")
-    running = False
+    _stop_event.set()
 
 
 def main():
     """主函数"""
-    global ranking_manager, rtsp_capture, running
+    global ranking_manager, rtsp_capture, event_loop
     
     log("=" * 50)
     log("AI 家庭漫画管家 - 后台服务模式")
@@ -250,6 +284,11 @@ def main():
     else:
         log("RTSP 连接失败，将在任务执行时重试")
     
+    # 启动常驻事件循环并创建客户端（会话在循环中首次使用时创建）
+    event_loop = asyncio.new_event_loop()
+    threading.Thread(target=event_loop.run_forever, name="comic-butler-loop", daemon=True).start()
+    run_in_loop(_refresh_clients())
+    
     # 初始化调度器
     scheduler = get_scheduler()
     scheduler.set_capture_callback(capture_task_sync)
@@ -270,11 +309,11 @@ def main():
     log("后台服务运行中，按 Ctrl+C 退出")
     log("-" * 50)
     
-    # 主循环
+    # 主线程等待退出信号，任务都在调度器线程中执行；
+    # 分段等待：Windows 上无超时的锁等待无法被 Ctrl+C 中断，信号处理函数将得不到执行
     try:
-        while running:
-            import time
-            time.sleep(1)
+        while not _stop_event.wait(1):
+            pass
     except KeyboardInterrupt:
         pass
     finally:
@@ -282,6 +321,13 @@ def main():
         
         scheduler.stop()
         
+        for client in (vision_client, push_client):
+            try:
+                run_in_loop(client.close())
+            except Exception as e:
+                log(f"关闭客户端失败: {e}")
+        event_loop.call_soon_threadsafe(event_loop.stop)
+        
         if rtsp_capture:
             rtsp_capture.release()
         
@@ -11,8 +11,7 @@ import base64
 from pathlib import Path
 from typing import Optional, Dict, Any
 from PIL import Image
-import io
-from image_utils import upload_image_to_imgbb
+from image_utils import encode_jpeg_to_size, release_stale_session, upload_image_to_imgbb_async
 
 
 class PushPlusClient:
@@ -38,12 +37,20 @@ class PushPlusClient:
         self.token = token
         self.imgbb_api_key = imgbb_api_key
         self._session: Optional[aiohttp.ClientSession] = None
+        self._session_loop: Optional[asyncio.AbstractEventLoop] = None
     
     async def _get_session(self) -> aiohttp.ClientSession:
         """获取或创建 aiohttp 会话"""
-        if self._session is None or self._session.closed:
+        # 会话绑定创建时的事件循环，循环变化时需要重建
+        loop = asyncio.get_running_loop()
+        if self._session is None or self._session.closed or self._session_loop is not loop:
+            stale, stale_loop = self._session, self._session_loop
             timeout = aiohttp.ClientTimeout(total=30)
-            self._session = aiohttp.ClientSession(timeout=timeout)
+            connector = aiohttp.TCPConnector(limit=20, keepalive_timeout=60)
+            self._session = aiohttp.ClientSession(timeout=timeout, connector=connector)
+            self._session_loop = loop
+            # 新会话就位后再释放旧会话，期间并发调用方不会重复创建
+            await release_stale_session(stale, stale_loop)
         return self._session
     
     async def close(self):
@@ -80,30 +87,8 @@ class PushPlusClient:
         
         # 压缩图片到极小尺寸（适应 PushPlus 2万字限制）
         target_size = 12 * 1024  # 目标 12KB
-        quality = 70
-        buffer = io.BytesIO()
-        img.save(buffer, 'JPEG', quality=quality)
-        
-        # 循环压缩
-        while buffer.tell() > target_size:
-            buffer = io.BytesIO()
-            
-            if quality > 20:
-                quality -= 10
-                img.save(buffer, 'JPEG', quality=quality)
-            else:
-                # 进一步缩小尺寸
-                new_width = int(img.width * 0.8)
-                new_height = int(img.height * 0.8)
-                if new_width < 50: 
-                    break
-                    
-                img = img.resize((new_width, new_height), Image.Resampling.LANCZOS)
-                quality = 60 
-                img.save(buffer, 'JPEG', quality=quality)
-        
-        buffer.seek(0)
-        img_base64 = base64.b64encode(buffer.getvalue()).decode('utf-8')
+        data = encode_jpeg_to_size(img, target_size)
+        img_base64 = base64.b64encode(data).decode('utf-8')
         
         return f"data:image/jpeg;base64,{img_base64}"
     
@@ -162,14 +147,17 @@ class PushPlusClient:
             # 1. 优先尝试 ImgBB 上传
             if self.imgbb_api_key:
                 print("[推送] 正在尝试上传图片到 ImgBB...")
-                image_src = upload_image_to_imgbb(image_path, self.imgbb_api_key)
+                image_src = await upload_image_to_imgbb_async(
+                    await self._get_session(), image_path, self.imgbb_api_key
+                )
             
             # 2. 如果 ImgBB 失败或未配置，降级到 Base64 (高压缩)
             if not image_src:
                 reason = "未配置 Key" if not self.imgbb_api_key else "上传失败"
                 print(f"[推送] ImgBB 不可用 ({reason})，使用 Base64 降级发送...")
                 # 注意：Base64 仍需保持极小尺寸以适应微信限制
-                image_src = self._image_to_base64(image_path)
+                # 解码/缩放/编码放到线程中执行，避免卡住事件循环
+                image_src = await asyncio.to_thread(self._image_to_base64, image_path)
             
             # 构建 HTML 内容
             html_content = f'''
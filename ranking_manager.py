@@ -6,13 +6,38 @@ Top N 排名管理模块
 
 import os
 import json
+import heapq
+import itertools
 import shutil
 from datetime import datetime, date
 from pathlib import Path
-from typing import Dict, List, Optional, Tuple
+from typing import Dict, List, Optional, Set, Tuple
 from dataclasses import dataclass, asdict
 import threading
 
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
+
+def _read_json(path: Path):
+    """读取 JSON 文件（优先使用 orjson）"""
+    if ORJSON_AVAILABLE:
+        return orjson.loads(path.read_bytes())
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def _write_json(path: Path, data) -> None:
+    """写入 JSON 文件（优先使用 orjson）"""
+    if ORJSON_AVAILABLE:
+        path.write_bytes(orjson.dumps(data, option=orjson.OPT_INDENT_2))
+        return
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+
 
 @dataclass
 class RankedImage:
@@ -38,7 +63,7 @@ class RankingManager:
     Top N 排名管理器
     
     功能：
-    - 维护当天得分最高的 N 张照片
+    - 维护当天得分最高的 N 张照片（按分数的小顶堆，堆顶即淘汰候选）
     - 自动清理被淘汰的低分照片
     - 持久化存储排名数据
     - 按日期归档历史数据
@@ -54,7 +79,11 @@ class RankingManager:
         """
         self.data_dir = Path(data_dir)
         self.top_n = top_n
-        self._rankings: List[RankedImage] = []
+        # 小顶堆，元素为 (分数, -入选序号, 图片)；同分时后入选的先被淘汰，与展示顺序（先入选的在前）一致
+        self._heap: List[Tuple[float, int, RankedImage]] = []
+        self._seq = itertools.count()
+        self._sorted_cache: Optional[List[RankedImage]] = None  # 按分数降序的视图，按需重建
+        self._paths: Set[str] = set()  # 已入选图片路径，用于 O(1) 判断是否在排名中
         self._current_date: str = ""
         self._lock = threading.RLock()
         
@@ -68,6 +97,20 @@ class RankingManager:
         # 加载今日数据
         self._load_today()
     
+    @property
+    def _rankings(self) -> List[RankedImage]:
+        """按分数降序排列的排名视图（堆变化后首次访问时重建）"""
+        if self._sorted_cache is None:
+            self._sorted_cache = [item for _, _, item in sorted(self._heap, key=lambda e: (-e[0], -e[1]))]
+        return self._sorted_cache
+    
+    def _set_rankings(self, items: List[RankedImage]):
+        """用给定列表重建堆"""
+        self._heap = [(item.score, -next(self._seq), item) for item in items]
+        heapq.heapify(self._heap)
+        self._sorted_cache = None
+        self._paths = {item.image_path for item in items}
+    
     def _get_ranking_file_path(self, date_str: str) -> Path:
         """获取排名数据文件路径"""
         return self.data_dir / f"ranking_{date_str}.json"
@@ -86,23 +129,20 @@ class RankingManager:
             
             if ranking_file.exists():
                 try:
-                    with open(ranking_file, 'r', encoding='utf-8') as f:
-                        data = json.load(f)
-                        self._rankings = [RankedImage.from_dict(item) for item in data]
+                    data = _read_json(ranking_file)
+                    self._set_rankings([RankedImage.from_dict(item) for item in data])
                 except Exception as e:
                     print(f"[排名管理] 加载排名数据失败: {e}")
-                    self._rankings = []
+                    self._set_rankings([])
             else:
-                self._rankings = []
+                self._set_rankings([])
     
     def _save_rankings(self):
         """保存排名数据到文件"""
         ranking_file = self._get_ranking_file_path(self._current_date)
         
         try:
-            with open(ranking_file, 'w', encoding='utf-8') as f:
-                json.dump([item.to_dict() for item in self._rankings], 
-                         f, ensure_ascii=False, indent=2)
+            _write_json(ranking_file, [item.to_dict() for item in self._rankings])
         except Exception as e:
             print(f"[排名管理] 保存排名数据失败: {e}")
     
@@ -159,24 +199,26 @@ class RankingManager:
                 capture_time=capture_time
             )
             
+            entry = (score, -next(self._seq), new_item)
+            
             # 如果还没满，直接加入
-            if len(self._rankings) < self.top_n:
-                self._rankings.append(new_item)
-                self._rankings.sort(key=lambda x: x.score, reverse=True)
+            if len(self._heap) < self.top_n:
+                heapq.heappush(self._heap, entry)
+                self._sorted_cache = None
+                self._paths.add(image_path)
                 self._save_rankings()
                 print(f"[排名管理] 图片入选 Top {self.top_n}，分数: {score:.3f}")
                 return (True, None)
             
-            # 检查是否能挤掉最低分的图片
-            lowest = self._rankings[-1]
+            # 检查是否能挤掉最低分的图片（堆顶）
+            lowest = self._heap[0][2]
             if score > lowest.score:
-                # 淘汰最低分图片
+                # 淘汰最低分图片，同时加入新图片
                 removed_path = lowest.image_path
-                self._rankings.remove(lowest)
-                
-                # 添加新图片
-                self._rankings.append(new_item)
-                self._rankings.sort(key=lambda x: x.score, reverse=True)
+                heapq.heapreplace(self._heap, entry)
+                self._sorted_cache = None
+                self._paths.discard(removed_path)
+                self._paths.add(image_path)
                 self._save_rankings()
                 
                 # 删除被淘汰的图片文件
@@ -222,6 +264,51 @@ class RankingManager:
         with self._lock:
             return self._rankings.copy()
     
+    def min_score(self) -> float:
+        """
+        获取当前排名中的最低分
+        
+        Returns:
+            堆顶（最低分）图片的分数，排名为空时返回 0
+        """
+        today = date.today().isoformat()
+        if self._current_date != today:
+            self._load_today()
+        
+        with self._lock:
+            return self._heap[0][0] if self._heap else 0.0
+    
+    def contains(self, image_path: str) -> bool:
+        """
+        判断图片是否在当前排名中
+        
+        Args:
+            image_path: 图片路径
+            
+        Returns:
+            是否已入选
+        """
+        today = date.today().isoformat()
+        if self._current_date != today:
+            self._load_today()
+        
+        with self._lock:
+            return image_path in self._paths
+    
+    def count(self) -> int:
+        """
+        获取当前入选照片数量（不复制列表）
+        
+        Returns:
+            排名中的照片数量
+        """
+        today = date.today().isoformat()
+        if self._current_date != today:
+            self._load_today()
+        
+        with self._lock:
+            return len(self._heap)
+    
     def update_cartoon_path(self, image_path: str, cartoon_path: str) -> bool:
         """
         更新图片对应的漫画重绘路径
@@ -234,7 +321,7 @@ class RankingManager:
             是否更新成功
         """
         with self._lock:
-            for item in self._rankings:
+            for _, _, item in self._heap:
                 if item.image_path == image_path:
                     item.cartoon_path = cartoon_path
                     self._save_rankings()
@@ -250,7 +337,7 @@ class RankingManager:
         """
         with self._lock:
             # 按拍摄时间排序
-            sorted_items = sorted(self._rankings, key=lambda x: x.capture_time)
+            sorted_items = sorted((item for _, _, item in self._heap), key=lambda x: x.capture_time)
             return [(item.cartoon_path or item.image_path, item.timestamp) 
                     for item in sorted_items if item.cartoon_path or item.image_path]
     
@@ -265,9 +352,13 @@ class RankingManager:
             是否删除成功
         """
         with self._lock:
-            for item in self._rankings:
+            for index, (_, _, item) in enumerate(self._heap):
                 if item.image_path == image_path:
-                    self._rankings.remove(item)
+                    self._heap[index] = self._heap[-1]
+                    self._heap.pop()
+                    heapq.heapify(self._heap)
+                    self._sorted_cache = None
+                    self._paths.discard(image_path)
                     self._cleanup_image(item)
                     self._save_rankings()
                     print(f"[排名管理] 已删除照片: {image_path}")
@@ -278,10 +369,10 @@ class RankingManager:
         """清空今日排名数据"""
         with self._lock:
             # 删除所有图片文件
-            for item in self._rankings:
+            for _, _, item in self._heap:
                 self._cleanup_image(item)
             
-            self._rankings = []
+            self._set_rankings([])
             self._save_rankings()
             print("[排名管理] 已清空今日数据")
     
@@ -300,9 +391,11 @@ class RankingManager:
         with self._lock:
             self.top_n = top_n
             
-            # 淘汰多余的图片
-            while len(self._rankings) > self.top_n:
-                lowest = self._rankings.pop()
+            # 淘汰多余的图片（从堆顶依次弹出最低分）
+            while len(self._heap) > self.top_n:
+                _, _, lowest = heapq.heappop(self._heap)
+                self._sorted_cache = None
+                self._paths.discard(lowest.image_path)
                 self._cleanup_image(lowest)
             
             self._save_rankings()
@@ -337,9 +430,8 @@ class RankingManager:
             return []
         
         try:
-            with open(archive_file, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-                return [RankedImage.from_dict(item) for item in data]
+            data = _read_json(archive_file)
+            return [RankedImage.from_dict(item) for item in data]
         except Exception as e:
             print(f"[排名管理] 读取历史数据失败: {e}")
             return []
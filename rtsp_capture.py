@@ -11,7 +11,6 @@ import time
 from datetime import datetime
 from pathlib import Path
 from typing import Optional, Callable
-from queue import Queue, Empty
 
 
 class RTSPCapture:
@@ -22,9 +21,12 @@ class RTSPCapture:
     - 连接 RTSP 视频流
     - 抓取当前画面
     - 自动重连机制
-    - 后台线程持续拉流（保持流畅）
+    - 后台线程持续 grab() 排空缓冲（不解码），抓拍时才 retrieve() 解码最新一帧
     """
     
+    OPEN_TIMEOUT_MSEC = 10000  # 打开流超时
+    READ_TIMEOUT_MSEC = 5000   # 读取超时
+    
     def __init__(self, rtsp_url: str, reconnect_interval: int = 5):
         """
         初始化捕获器
@@ -39,6 +41,11 @@ class RTSPCapture:
         self._cap: Optional[cv2.VideoCapture] = None
         self._latest_frame: Optional[np.ndarray] = None
         self._frame_lock = threading.Lock()
+        # 抓拍请求：后台线程在下一次 grab() 后解码一帧并置位 _frame_ready
+        self._request_lock = threading.Lock()
+        self._frame_requested = threading.Event()
+        self._frame_ready = threading.Event()
+        self._reconnect_requested = threading.Event()
         self._running = False
         self._connected = False
         self._capture_thread: Optional[threading.Thread] = None
@@ -89,8 +96,8 @@ class RTSPCapture:
             
             # 设置超时和缓冲
             self._cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
-            self._cap.set(cv2.CAP_PROP_OPEN_TIMEOUT_MSEC, 10000)  # 10秒打开超时
-            self._cap.set(cv2.CAP_PROP_READ_TIMEOUT_MSEC, 5000)   # 5秒读取超时
+            self._cap.set(cv2.CAP_PROP_OPEN_TIMEOUT_MSEC, self.OPEN_TIMEOUT_MSEC)
+            self._cap.set(cv2.CAP_PROP_READ_TIMEOUT_MSEC, self.READ_TIMEOUT_MSEC)
             
             # 尝试读取一帧检查连接
             ret, frame = self._cap.read()
@@ -126,12 +133,52 @@ class RTSPCapture:
         self._capture_thread.start()
         print("[RTSP] 后台捕获线程已启动")
     
+    def _join_capture_thread(self) -> bool:
+        """
+        等待后台线程退出
+        
+        超时需覆盖一次打开 + 读取的最长阻塞时间，否则线程可能仍在 grab() 中
+        
+        Returns:
+            线程是否已退出
+        """
+        if self._capture_thread is None:
+            return True
+        self._capture_thread.join(timeout=(self.OPEN_TIMEOUT_MSEC + self.READ_TIMEOUT_MSEC) / 1000 + 1)
+        if self._capture_thread.is_alive():
+            return False
+        self._capture_thread = None
+        return True
+    
     def stop_background_capture(self):
         """停止后台捕获线程"""
         self._running = False
-        if self._capture_thread:
-            self._capture_thread.join(timeout=2)
-        print("[RTSP] 后台捕获线程已停止")
+        if self._join_capture_thread():
+            print("[RTSP] 后台捕获线程已停止")
+        else:
+            print("[RTSP] 后台捕获线程未能及时退出，将在当前读取结束后自行停止")
+    
+    def get_frame(self, timeout: float = 1.0) -> Optional[np.ndarray]:
+        """
+        请求后台线程解码最新一帧（后台拉流时使用）
+        
+        Args:
+            timeout: 等待新帧的超时时间（秒）
+            
+        Returns:
+            最新画面帧，超时则返回最近缓存的帧，都没有时返回 None
+        """
+        with self._request_lock:
+            self._frame_ready.clear()
+            self._frame_requested.set()
+            ready = self._frame_ready.wait(timeout)
+        
+        with self._frame_lock:
+            if self._latest_frame is None:
+                return None
+            if not ready:
+                print("[RTSP] 等待新帧超时，使用缓存帧")
+            return self._latest_frame.copy()
     
     def _capture_loop(self):
         """后台捕获循环"""
@@ -146,13 +193,26 @@ class RTSPCapture:
                         time.sleep(self.reconnect_interval)
                         continue
                 
-                # 读取一帧
-                ret, frame = self._cap.read()
+                # URL 变更：由后台线程自己重连，避免在 grab() 期间释放
+                if self._reconnect_requested.is_set():
+                    self._reconnect_requested.clear()
+                    self.connect()
+                    continue
                 
-                if ret and frame is not None:
-                    with self._frame_lock:
-                        self._latest_frame = frame
-                    
+                # 只取帧不解码，保持缓冲区为最新；有抓拍请求时才解码
+                ret = self._cap.grab()
+                if ret and self._frame_requested.is_set():
+                    self._frame_requested.clear()
+                    ret, frame = self._cap.retrieve()
+                    if ret and frame is not None:
+                        with self._frame_lock:
+                            self._latest_frame = frame
+                        self._frame_ready.set()
+                    else:
+                        # 解码失败，下一帧重试
+                        self._frame_requested.set()
+                
+                if ret:
                     if not self._connected:
                         self._notify_status(True, "连接恢复")
                 else:
@@ -164,9 +224,10 @@ class RTSPCapture:
                 print(f"[RTSP] 捕获循环异常: {e}")
                 time.sleep(1)
         
-        # 清理
+        # 清理：线程退出时由自身释放，避免与仍在进行的 grab() 并发
         if self._cap:
             self._cap.release()
+            self._cap = None
     
     def capture(self, force_fresh: bool = True) -> Optional[np.ndarray]:
         """
@@ -178,16 +239,14 @@ class RTSPCapture:
         Returns:
             画面帧（numpy 数组），如果失败返回 None
         """
+        # 后台线程正在拉流时，VideoCapture 由后台线程独占，请求其解码最新帧
+        if self._running:
+            return self.get_frame()
+        
         if force_fresh and self._cap and self._cap.isOpened():
-            # 使用 grab() 快速丢弃缓冲区中的旧帧
-            # grab() 比 read() 快很多，只获取帧但不解码
-            for _ in range(10):
-                self._cap.grab()
+            frame = self.grab_latest()
             
-            # 读取最新帧
-            ret, frame = self._cap.read()
-            
-            if ret and frame is not None:
+            if frame is not None:
                 with self._frame_lock:
                     self._latest_frame = frame
                 print(f"[RTSP] 获取到最新帧")
@@ -209,6 +268,32 @@ class RTSPCapture:
         
         return None
     
+    def grab_latest(self, flush_seconds: float = 0.1) -> Optional[np.ndarray]:
+        """
+        丢弃缓冲区中的旧帧后解码最新一帧
+        
+        grab() 只取帧不解码，在 flush_seconds 内反复调用以清空缓冲区，
+        最后 retrieve() 一次；按时间而非固定次数限制，避免在低帧率流上阻塞过久。
+        
+        Returns:
+            最新画面帧，失败返回 None
+        """
+        if not self._cap or not self._cap.isOpened():
+            return None
+        
+        grabbed = False
+        deadline = time.monotonic() + flush_seconds
+        while time.monotonic() < deadline:
+            if not self._cap.grab():
+                break
+            grabbed = True
+        
+        if grabbed:
+            ret, frame = self._cap.retrieve()
+        else:
+            ret, frame = self._cap.read()
+        return frame if ret and frame is not None else None
+    
     def capture_and_save(self, 
                          output_dir: str, 
                          filename_prefix: str = "capture") -> Optional[str]:
@@ -229,6 +314,23 @@ class RTSPCapture:
             print("[RTSP] 抓取失败：无法获取画面")
             return None
         
+        return self.save_frame(frame, output_dir, filename_prefix)
+    
+    def save_frame(self,
+                   frame: np.ndarray,
+                   output_dir: str,
+                   filename_prefix: str = "capture") -> Optional[str]:
+        """
+        将已抓取的画面保存到文件
+        
+        Args:
+            frame: BGR 画面
+            output_dir: 输出目录
+            filename_prefix: 文件名前缀
+            
+        Returns:
+            保存的文件路径，如果失败返回 None
+        """
         try:
             # 确保目录存在
             Path(output_dir).mkdir(parents=True, exist_ok=True)
@@ -261,10 +363,10 @@ class RTSPCapture:
         """释放资源"""
         self._running = False
         
-        if self._capture_thread:
-            self._capture_thread.join(timeout=2)
-        
-        if self._cap:
+        # 后台线程仍在读取时不能释放，交给线程退出时自行释放
+        if not self._join_capture_thread():
+            print("[RTSP] 后台捕获线程仍在读取，退出后将自行释放连接")
+        elif self._cap:
             self._cap.release()
             self._cap = None
         
@@ -294,11 +396,9 @@ class RTSPCapture:
         """
         self.rtsp_url = new_url
         
-        # 如果正在运行，重新连接
+        # 如果正在运行，交给后台线程重新连接
         if self._running:
-            if self._cap:
-                self._cap.release()
-            self.connect()
+            self._reconnect_requested.set()
 
 
 class MockRTSPCapture(RTSPCapture):
@@ -319,7 +419,11 @@ class MockRTSPCapture(RTSPCapture):
         self._notify_status(True, "[模拟] 连接成功")
         return True
     
-    def capture(self) -> Optional[np.ndarray]:
+    def start_background_capture(self):
+        """模拟捕获器无需后台拉流"""
+        pass
+    
+    def capture(self, force_fresh: bool = True) -> Optional[np.ndarray]:
         """生成模拟画面"""
         # 生成 640x480 的随机图像
         frame = np.random.randint(100, 200, (480, 640, 3), dtype=np.uint8)
@@ -205,6 +205,7 @@ class TaskScheduler:
 
 # 全局调度器实例
 _scheduler: Optional[TaskScheduler] = None
+_scheduler_lock = threading.Lock()
 
 
 def get_scheduler() -> TaskScheduler:
@@ -216,7 +217,9 @@ def get_scheduler() -> TaskScheduler:
     """
     global _scheduler
     if _scheduler is None:
-        _scheduler = TaskScheduler()
+        with _scheduler_lock:
+            if _scheduler is None:
+                _scheduler = TaskScheduler()
     return _scheduler
 
 
@@ -14,6 +14,7 @@ from pathlib import Path
 from typing import Optional, Dict, Any, Tuple
 from PIL import Image
 import requests
+from image_utils import release_stale_session
 
 
 class VisionClient:
@@ -51,6 +52,7 @@ class VisionClient:
         self.token = token
         self.max_retries = max_retries
         self._session: Optional[aiohttp.ClientSession] = None
+        self._session_loop: Optional[asyncio.AbstractEventLoop] = None
     
     def _get_headers(self) -> Dict[str, str]:
         """获取请求头"""
@@ -61,9 +63,16 @@ class VisionClient:
     
     async def _get_session(self) -> aiohttp.ClientSession:
         """获取或创建 aiohttp 会话"""
-        if self._session is None or self._session.closed:
+        # 会话绑定创建时的事件循环，循环变化时需要重建
+        loop = asyncio.get_running_loop()
+        if self._session is None or self._session.closed or self._session_loop is not loop:
+            stale, stale_loop = self._session, self._session_loop
             timeout = aiohttp.ClientTimeout(total=120)  # 2分钟超时
-            self._session = aiohttp.ClientSession(timeout=timeout)
+            connector = aiohttp.TCPConnector(limit=20, keepalive_timeout=60)
+            self._session = aiohttp.ClientSession(timeout=timeout, connector=connector)
+            self._session_loop = loop
+            # 新会话就位后再释放旧会话，期间并发调用方不会重复创建
+            await release_stale_session(stale, stale_loop)
         return self._session
     
     async def close(self):
@@ -170,19 +179,14 @@ class VisionClient:
         
         return {'error': 'Max retries exceeded', 'status': -1}
     
-    async def classify_image(self, image_path: str) -> Tuple[bool, str, float]:
+    async def _detect(self, img_base64: str) -> Tuple[bool, str, float]:
         """
-        检测图片中是否有人物
+        人体检测（输入为已编码的图片）
         
-        Args:
-            image_path: 图片路径
-            
         Returns:
             (是否有人物, 检测到的类别, 置信度)
         """
         try:
-            img_base64 = self._image_to_base64(image_path, max_size_kb=512)
-            
             payload = {
                 'input': {
                     'image': f'data:image/jpeg;base64,{img_base64}'
@@ -223,19 +227,14 @@ class VisionClient:
             print(f"[AI服务] 人体检测异常: {e}")
             return (False, 'error', 0.0)
     
-    async def score_image(self, image_path: str) -> float:
+    async def _assess(self, img_base64: str) -> float:
         """
-        评估图片的审美质量分数
+        审美打分（输入为已编码的图片）
         
-        Args:
-            image_path: 图片路径
-            
         Returns:
             质量分数 (0-1)
         """
         try:
-            img_base64 = self._image_to_base64(image_path, max_size_kb=512)
-            
             payload = {
                 'input': {
                     'image': f'data:image/jpeg;base64,{img_base64}'
@@ -280,6 +279,66 @@ class VisionClient:
             print(f"[AI服务] 打分异常: {e}")
             return 0.0
     
+    async def analyze(self, image_path: str) -> Tuple[bool, str, float, float]:
+        """
+        人物检测 + 审美打分
+        
+        图片只编码一次；先检测人物，检测到人物时才发出打分请求
+        （无人画面最常见，不为其消耗打分接口的调用次数）
+        
+        Args:
+            image_path: 图片路径
+            
+        Returns:
+            (是否有人物, 检测到的类别, 置信度, 质量分数)
+        """
+        try:
+            img_base64 = await asyncio.to_thread(self._image_to_base64, image_path, 512)
+        except Exception as e:
+            print(f"[AI服务] 图片编码失败: {e}")
+            return (False, 'error', 0.0, 0.0)
+        
+        has_person, label, conf = await self._detect(img_base64)
+        if not has_person:
+            return (False, label, conf, 0.0)
+        
+        score = await self._assess(img_base64)
+        return (True, label, conf, score)
+    
+    async def classify_image(self, image_path: str) -> Tuple[bool, str, float]:
+        """
+        检测图片中是否有人物
+        
+        Args:
+            image_path: 图片路径
+            
+        Returns:
+            (是否有人物, 检测到的类别, 置信度)
+        """
+        try:
+            img_base64 = self._image_to_base64(image_path, max_size_kb=512)
+        except Exception as e:
+            print(f"[AI服务] 人体检测异常: {e}")
+            return (False, 'error', 0.0)
+        return await self._detect(img_base64)
+    
+    async def score_image(self, image_path: str) -> float:
+        """
+        评估图片的审美质量分数
+        
+        Args:
+            image_path: 图片路径
+            
+        Returns:
+            质量分数 (0-1)
+        """
+        try:
+            img_base64 = self._image_to_base64(image_path, max_size_kb=512)
+        except Exception as e:
+            print(f"[AI服务] 打分异常: {e}")
+            return 0.0
+        return await self._assess(img_base64)
+    
     async def cartoon_image(self, image_path: str, output_path: str) -> bool:
         """
         将人物照片转换为漫画风格
@@ -350,6 +409,10 @@ class VisionClient:
         """分类图片（同步版本）"""
         return asyncio.run(self.classify_image(image_path))
     
+    def analyze_sync(self, image_path: str) -> Tuple[bool, str, float, float]:
+        """检测 + 打分（同步版本）"""
+        return asyncio.run(self.analyze(image_path))
+    
     def score_image_sync(self, image_path: str) -> float:
         """图片打分（同步版本）"""
         return asyncio.run(self.score_image(image_path))
@@ -382,6 +445,13 @@ class MockVisionClient(VisionClient):
         await asyncio.sleep(0.5)
         return round(random.uniform(0.4, 0.95), 3)
     
+    async def analyze(self, image_path: str) -> Tuple[bool, str, float, float]:
+        """模拟检测 + 打分：一次延迟同时返回"""
+        import random
+        print(f"[模拟AI] 分析图片: {image_path}")
+        await asyncio.sleep(0.5)
+        return (True, 'person', 0.95, round(random.uniform(0.4, 0.95), 3))
+    
     async def cartoon_image(self, image_path: str, output_path: str) -> bool:
         """模拟重绘：复制原图"""
         import shutil